@@ -0,0 +1,52 @@
+from collections import namedtuple
+from http_poller import UNCLAIMED_COLUMN
+
+ColumnCard = namedtuple("ColumnCard", ["id", "title", "index", "rect", "element"])
+
+# Runs in the page and returns every card of a column in one WebDriver call.
+# Card ids follow the same rule as http_poller: the closest data-id (or id) inside the column.
+EXTRACT_COLUMN_JS = """
+var heads = document.getElementsByClassName("title-name");
+for (var i = 0; i < heads.length; i++) {
+	if (heads[i].innerText.trim() !== arguments[0]) {
+		continue;
+	}
+	var column = heads[i].parentElement.parentElement.parentElement;
+	var names = column.getElementsByClassName("card-name");
+	var cards = [];
+	for (var j = 0; j < names.length; j++) {
+		var el = names[j];
+		var id = null;
+		for (var p = el; p && p !== column && !id; p = p.parentElement) {
+			id = p.getAttribute("data-id") || p.id || null;
+		}
+		var r = el.getBoundingClientRect();
+		cards.push({
+			"id": id,
+			"title": el.innerText.trim(),
+			"index": j,
+			"rect": [r.left, r.top, r.width, r.height],
+			"el": el,
+		});
+	}
+	return cards;
+}
+return null;
+"""
+
+def extract_column(driver, column_title=UNCLAIMED_COLUMN):
+	"""
+	Returns the cards of a column as ColumnCards, in board order, using one injected script.
+	Returns an empty list if the column is not on the page.
+	"""
+	raw = driver.execute_script(EXTRACT_COLUMN_JS, column_title) or []
+	cards = []
+	seen = {}
+	for c in raw:
+		card_id = c["id"]
+		if not card_id:
+			n = seen.get(c["title"], 0)
+			seen[c["title"]] = n + 1
+			card_id = f"{c['title']}#{n}"
+		cards.append(ColumnCard(card_id, c["title"], c["index"], tuple(c["rect"]), c["el"]))
+	return cards
@@ -0,0 +1,25 @@
+class ColumnSnapshot:
+	"""
+	Indexed snapshot of the unclaimed column, keyed by card id.
+	Comparing ids instead of the list count catches a card being claimed and another being
+	added in the same interval.
+	"""
+
+	def __init__(self, cards=()):
+		self.cards = {c.id: c for c in cards}
+
+	def titles(self):
+		return {c.title for c in self.cards.values()}
+
+	def diff(self, cards):
+		"""Returns (added, removed) cards compared to this snapshot, in board order for added cards."""
+		ids = {c.id for c in cards}
+		added = [c for c in cards if c.id not in self.cards]
+		removed = [c for card_id, c in self.cards.items() if card_id not in ids]
+		return added, removed
+
+	def update(self, cards):
+		"""Diffs against the new cards and then takes them as the snapshot."""
+		added, removed = self.diff(cards)
+		self.cards = {c.id: c for c in cards}
+		return added, removed
@@ -0,0 +1,146 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote
+import urllib3
+from http_poller import BoardPoller, Card, made_up_id
+
+CLAIMED = "claimed"
+MISSED = "missed"
+
+class CommentClaimer:
+	"""
+	Claims cards by posting the claim comment straight over the logged-in HTTP session,
+	many cards at a time, instead of driving the comment popup with the mouse.
+	comment_url and comments_url are templates filled with {card_id}. If comments_url is set, a
+	card that already has comments counts as missed, like the '1.png' check of the GUI path.
+	A card whose claim fails gets None, so the caller can fall back to the GUI path for it. So does
+	a card the board gave no id, as there is no url to post its comment to.
+	"""
+
+	def __init__(self, poller, comment_url, comments_url="", comment="1", comment_field="comment", workers=8, timeout=5.0):
+		self.poller = poller
+		self.comment_url = comment_url
+		self.comments_url = comments_url
+		self.comment = comment
+		self.comment_field = comment_field
+		self.workers = workers
+		self.http = urllib3.PoolManager(
+			maxsize=workers,
+			retries=False,
+			timeout=urllib3.Timeout(connect=timeout, read=timeout),
+			)
+		self.timings = {} # card id: (start, end) in perf_counter seconds
+
+	def headers(self):
+		with self.poller.lock:
+			return dict(self.poller.headers)
+
+	def has_comments(self, card_id):
+		r = self.http.request("GET", self.comments_url.format(card_id=quote(card_id, safe="")), headers=self.headers())
+		if r.status != 200:
+			raise ValueError(f"Comments returned HTTP {r.status}.")
+		payload = json.loads(r.data)
+		if isinstance(payload, dict):
+			payload = payload.get("data")
+		return bool(payload)
+
+	def claim(self, card):
+		"""Claims one card. Returns CLAIMED, MISSED, or None if the request failed or the card has no id."""
+		if made_up_id(card):
+			print(f"{card.title} has no id on the board, leaving it for the GUI.")
+			return None
+		start = time.perf_counter()
+		try:
+			if self.comments_url and self.has_comments(card.id):
+				return MISSED
+			r = self.http.request_encode_body(
+				"POST",
+				self.comment_url.format(card_id=quote(card.id, safe="")),
+				fields={self.comment_field: self.comment},
+				headers=self.headers(),
+				encode_multipart=False,
+				)
+			if r.status not in (200, 201):
+				print(f"Claiming {card.title} returned HTTP {r.status}.")
+				return None
+			return CLAIMED
+		except (urllib3.exceptions.HTTPError, ValueError) as e:
+			print(f"Claiming {card.title} failed: {e}")
+			return None
+		finally:
+			self.timings[card.id] = (start, time.perf_counter())
+
+	def claim_all(self, cards):
+		"""Claims cards concurrently. Returns {card id: CLAIMED/MISSED/None}."""
+		with ThreadPoolExecutor(max_workers=self.workers) as pool:
+			results = list(pool.map(self.claim, cards))
+		return {card.id: result for card, result in zip(cards, results)}
+
+def serve_stub_comment_api(commented=(), port=0):
+	"""
+	Starts a local stand-in for the comment endpoints on a background thread.
+	GET /comments/<id> lists comments, POST /comment/<id> adds one. Cards in commented start
+	with a comment. Every request is recorded in server.requests as (method, card id, fields, time).
+	"""
+	comments = {card_id: ["someone else"] for card_id in commented}
+	requests = []
+	lock = threading.Lock()
+
+	class Handler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+		disable_nagle_algorithm = True
+
+		def reply(self, status, payload):
+			body = json.dumps(payload).encode("utf-8")
+			self.send_response(status)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def do_GET(self):
+			card_id = self.path.rsplit("/", 1)[-1]
+			with lock:
+				requests.append(("GET", card_id, None, time.perf_counter()))
+				data = list(comments.get(card_id, []))
+			self.reply(200, {"data": data})
+
+		def do_POST(self):
+			card_id = self.path.rsplit("/", 1)[-1]
+			length = int(self.headers.get("Content-Length", 0))
+			fields = parse_qs(self.rfile.read(length).decode("utf-8"))
+			time.sleep(0.05) # pretend the server takes a while
+			with lock:
+				requests.append(("POST", card_id, fields, time.perf_counter()))
+				comments.setdefault(card_id, []).append(fields)
+			self.reply(200, {"status": 1})
+
+		def log_message(self, *args):
+			pass
+
+	server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+	server.requests = requests
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def main():
+	server = serve_stub_comment_api(commented=["3"])
+	base = f"http://127.0.0.1:{server.server_address[1]}"
+	poller = BoardPoller(f"{base}/board", [{"name": "tapdsession", "value": "test"}])
+	claimer = CommentClaimer(poller, f"{base}/comment/{{card_id}}", f"{base}/comments/{{card_id}}")
+
+	cards = [Card(str(i), f"Movie {i}") for i in range(20)]
+	t = time.perf_counter()
+	results = claimer.claim_all(cards)
+	total = time.perf_counter() - t
+
+	print(f"Claimed {sum(r == CLAIMED for r in results.values())}, missed {sum(r == MISSED for r in results.values())} in {round(total*1000)}ms")
+	posts = [r for r in server.requests if r[0] == "POST"]
+	print(f"Stub recorded {len(posts)} comment posts over {round((posts[-1][3] - posts[0][3])*1000)}ms")
+	server.shutdown()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,113 @@
+import threading
+import traceback
+from queue import PriorityQueue, Empty
+from urllib.parse import urlparse
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from board_dom import extract_column
+
+class ClaimExecutor:
+	"""
+	Spreads GUI claims over several driver sessions that share the main driver's login.
+	Each worker opens its next card's popup on its own (page loads and the editor-area wait
+	happen in parallel). The screen and mouse are shared, so the detect/comment/close steps
+	run one worker at a time and strictly in claim_seq order: a worker whose popup is ready
+	waits until every card before its own is done or given up on.
+	The sessions are opened up front so a claim does not wait for browsers to start.
+	"""
+
+	def __init__(self, make_driver, url, cookies, workers):
+		self.url = url
+		self.gui_turn = threading.Condition()
+		self.turn = 0 # claim_seq position of the next card allowed on screen
+		self.finished = set() # positions claimed or given up on in this claim() call
+		self.drivers = []
+		for i in range(workers):
+			driver = make_driver()
+			driver.minimize_window()
+			share_login(driver, url, cookies)
+			self.drivers.append(driver)
+
+	def claim(self, cards, gui_claim):
+		"""
+		Claims cards, given in claim order. Returns [(card, result, evidence)] in that same order.
+		gui_claim() does the claim steps on whatever window is in front and returns (result, evidence).
+		Cards a worker could not open get result None, for the caller to claim another way.
+		"""
+		queue = PriorityQueue()
+		for priority, card in enumerate(cards):
+			queue.put((priority, card))
+		results = {}
+		with self.gui_turn:
+			self.turn = 0
+			self.finished = set()
+
+		def work(driver):
+			while True:
+				try:
+					priority, card = queue.get_nowait()
+				except Empty:
+					return
+				try:
+					results[priority] = (card,) + self.claim_one(driver, priority, card, gui_claim)
+				except Exception:
+					traceback.print_exc()
+					results[priority] = (card, None, None)
+				finally:
+					self.finish(priority)
+
+		threads = [threading.Thread(target=work, args=(d,)) for d in self.drivers]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		return [results[i] for i in range(len(cards))]
+
+	def finish(self, priority):
+		"""Marks a card as done and lets the next ones in order onto the screen."""
+		with self.gui_turn:
+			self.finished.add(priority)
+			while self.turn in self.finished:
+				self.turn += 1
+			self.gui_turn.notify_all()
+
+	def claim_one(self, driver, priority, card, gui_claim):
+		found = [c for c in extract_column(driver) if c.id == card.id]
+		if not found:
+			driver.refresh()
+			WebDriverWait(driver, 10).until(
+				EC.presence_of_element_located((By.CLASS_NAME, "card-name"))
+			)
+			found = [c for c in extract_column(driver) if c.id == card.id]
+		if not found:
+			return (None, None)
+		found[0].element.click()
+		WebDriverWait(driver, 10).until(
+			EC.element_to_be_clickable((By.CLASS_NAME, "editor-area"))
+		)
+		#cards are handed out in order, so every earlier card is held by a worker that will
+		#finish it (its waits are bounded) and this wait always ends
+		with self.gui_turn:
+			self.gui_turn.wait_for(lambda: self.turn == priority)
+			driver.maximize_window()
+			try:
+				return gui_claim()
+			finally:
+				driver.minimize_window()
+
+	def quit(self):
+		for driver in self.drivers:
+			driver.quit()
+
+def share_login(driver, url, cookies):
+	"""Gives a fresh driver the session of another one, then opens the board."""
+	parts = urlparse(url)
+	driver.get(f"{parts.scheme}://{parts.netloc}/")
+	for c in cookies:
+		c = {k: v for k, v in c.items() if k in ("name", "value", "path", "domain", "secure", "httpOnly", "expiry")}
+		try:
+			driver.add_cookie(c)
+		except Exception:
+			pass # cookie for another domain
+	driver.get(url)
@@ -0,0 +1,83 @@
+import json
+import hashlib
+import threading
+from types import MappingProxyType
+from storage import get_backend
+
+def freeze(obj):
+	"""Returns a read-only copy of loaded json: dicts become mapping proxies, lists become tuples."""
+	if isinstance(obj, dict):
+		return MappingProxyType({k: freeze(v) for k, v in obj.items()})
+	if isinstance(obj, list):
+		return tuple(freeze(v) for v in obj)
+	return obj
+
+class ConfigStore:
+	"""
+	Shared in-memory copy of the save files.
+	Each file is read once and then served as an immutable snapshot. A watcher thread reloads
+	a file only when its storage version changes and its content hash differs, and Database.save()
+	pushes new data straight in, so readers on the poll loop never touch the disk.
+	Snapshots are swapped, never mutated, so 'is' tells a reader whether anything changed.
+	"""
+
+	def __init__(self, check_interval=1.0):
+		self.check_interval = check_interval
+		self.lock = threading.Lock()
+		self.snapshots = {}
+		self.stamps = {} # save_file: (storage version, content hash)
+		self.watcher = None
+		self.stopped = threading.Event()
+
+	def get(self, save_file):
+		"""Returns the current snapshot of a save file. Only the first call for a file reads it."""
+		snapshot = self.snapshots.get(save_file)
+		if snapshot is None:
+			self.reload(save_file)
+			snapshot = self.snapshots[save_file]
+		return snapshot
+
+	def push(self, save_file, data, text):
+		"""Swaps in new data for a save file that has just been written as text."""
+		snapshot = freeze(data)
+		digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+		version = get_backend().version(save_file)
+		with self.lock:
+			self.snapshots[save_file] = snapshot
+			self.stamps[save_file] = (version, digest)
+
+	def reload(self, save_file):
+		"""Re-reads a save file if its version changed since it was last loaded or pushed and its content differs."""
+		backend = get_backend()
+		with self.lock:
+			old = self.stamps.get(save_file)
+			version = backend.version(save_file)
+			if save_file in self.snapshots and old and version == old[0]:
+				return
+			raw = backend.read(save_file)
+			if raw is None:
+				self.snapshots.setdefault(save_file, freeze({}))
+				self.stamps[save_file] = None
+				return
+			digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+			if not (save_file in self.snapshots and old and old[1] == digest):
+				try:
+					data = json.loads(raw)
+				except ValueError:
+					return # corrupt save, keep the old snapshot and retry next check
+				self.snapshots[save_file] = freeze(data)
+			self.stamps[save_file] = (version, digest)
+
+	def watch(self):
+		"""Starts the watcher thread that picks up edits made outside this process."""
+		if self.watcher:
+			return
+		self.watcher = threading.Thread(target=self.run, daemon=True)
+		self.watcher.start()
+
+	def run(self):
+		while not self.stopped.wait(self.check_interval):
+			for save_file in list(self.snapshots):
+				self.reload(save_file)
+
+store = ConfigStore()
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import platform
+import subprocess
+import cv2
+import numpy as np
+from image_detection import Detector, EXHAUSTIVE, PYRAMID
+from screen_capture import ReplayCapture, convert, latency_report
+
+CORPUS_VERSION = 1
+BENCHMARK_DIR = "benchmarks" # generated corpus and reports, kept out of git
+CORPUS_DIR = os.path.join(BENCHMARK_DIR, "detection_corpus")
+REPORT_DIR = os.path.join(BENCHMARK_DIR, "reports")
+TEMPLATE = os.path.join("files", "1.png")
+THRESHOLDS = (0.8, 0.85, 0.9, 0.95)
+TOLERANCE = 3 # px a match may be off from the labelled position and still count
+SCREENS = (
+	("1080p", 1920, 1080),
+	("1440p", 2560, 1440),
+	("4k", 3840, 2160), # high dpi
+	("5k", 5120, 2880),
+	("dual-1080p", 3840, 1080), # multi monitor
+	("triple-1080p", 5760, 1080),
+	)
+
+def build_corpus(directory=CORPUS_DIR, template_file_name=TEMPLATE, seed=0):
+	"""
+	Writes a labelled corpus of synthetic screenshots: a busy page with the template pasted at
+	known spots, plus half-covered and noisy copies that should not count as matches.
+	The corpus is deterministic for a given CORPUS_VERSION and seed. Recorded screenshots can be
+	added to manifest.json by hand with the same fields.
+	"""
+	rng = np.random.default_rng(seed)
+	template = cv2.imread(template_file_name)
+	h, w = template.shape[:2]
+	os.makedirs(directory, exist_ok=True)
+	cases = []
+	for name, width, height in SCREENS:
+		img = np.full((height, width, 3), 245, np.uint8)
+		for i in range(width * height // 20000):
+			x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+			color = tuple(int(c) for c in rng.integers(0, 255, 3))
+			if i % 3:
+				cv2.putText(img, "".join(chr(int(c)) for c in rng.integers(65, 123, 8)), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+			else:
+				cv2.rectangle(img, (x, y), (x + int(rng.integers(20, 200)), y + int(rng.integers(10, 60))), color, -1)
+
+		#one spot per cell of a coarse grid keeps the pasted copies from overlapping
+		cells = [(cx, cy) for cx in range(0, width - w * 2, w * 3) for cy in range(0, height - h * 2, h * 3)]
+		spots = rng.permutation(len(cells))
+		matches = []
+		for n, i in enumerate(spots[:8]):
+			x, y = cells[i]
+			if n < 5:
+				img[y:y + h, x:x + w] = template
+				matches.append([int(x), int(y)])
+			elif n < 7:
+				img[y:y + h, x:x + w] = template
+				img[y:y + h, x:x + w // 2] = 245 #half covered
+			else:
+				img[y:y + h, x:x + w] = np.clip(template + rng.normal(0, 60, template.shape), 0, 255).astype(np.uint8)
+		file_name = f"{name}.png"
+		cv2.imwrite(os.path.join(directory, file_name), img)
+		cases.append({"screenshot": file_name, "template": os.path.basename(template_file_name), "matches": matches})
+
+	cv2.imwrite(os.path.join(directory, os.path.basename(template_file_name)), template)
+	manifest = {"version": CORPUS_VERSION, "cases": cases}
+	with open(os.path.join(directory, "manifest.json"), "w") as f:
+		json.dump(manifest, f, indent=4)
+	return manifest
+
+def load_corpus(directory=CORPUS_DIR):
+	"""Returns the corpus manifest, building the corpus first if it is missing or from another version."""
+	try:
+		with open(os.path.join(directory, "manifest.json")) as f:
+			manifest = json.load(f)
+		if manifest.get("version") == CORPUS_VERSION:
+			return manifest
+	except (OSError, ValueError):
+		pass
+	return build_corpus(directory)
+
+def score(found, truth):
+	"""Returns (true positives, false positives, false negatives) of found [(x, y)] against the labelled positions."""
+	unmatched = list(truth)
+	tp = 0
+	for x, y in found:
+		for t in unmatched:
+			if abs(x - t[0]) <= TOLERANCE and abs(y - t[1]) <= TOLERANCE:
+				unmatched.remove(t)
+				tp += 1
+				break
+	return tp, len(found) - tp, len(unmatched)
+
+def commit():
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return "unknown"
+
+def run_benchmark(directory=CORPUS_DIR, modes=(EXHAUSTIVE, PYRAMID), thresholds=THRESHOLDS, repeats=3, live_capture=True):
+	"""
+	Runs detect_all() over every corpus screenshot for each matching mode and threshold, with
+	frames coming from the replay capture backend. Returns a dict ready to be saved as json with,
+	per mode and threshold: ms per call, calls and megapixels per second, precision and recall.
+	If live_capture is set, the screen capture backends available here are timed as well.
+	"""
+	manifest = load_corpus(directory)
+	results = []
+	for mode in modes:
+		detector = Detector(mode=mode)
+		for threshold in thresholds:
+			times = []
+			pixels = 0
+			tp = fp = fn = 0
+			for case in manifest["cases"]:
+				template_file_name = os.path.join(directory, case["template"])
+				capture = ReplayCapture(os.path.join(directory, case["screenshot"]))
+				detector.template(template_file_name)
+				for i in range(repeats):
+					t = time.perf_counter()
+					img_gray = convert(capture.grab(), capture.to_gray)
+					found = detector.match_all(img_gray, (0, 0), template_file_name, threshold)
+					times.append(time.perf_counter() - t)
+				pixels += img_gray.size * repeats
+				a, b, c = score([(m[0], m[2]) for m in found], case["matches"])
+				tp, fp, fn = tp + a, fp + b, fn + c
+			total = sum(times)
+			result = {
+				"mode": mode,
+				"threshold": threshold,
+				"ms_per_call": round(total / len(times) * 1000, 2),
+				"p95_ms": round(sorted(times)[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 2),
+				"calls_per_s": round(len(times) / total, 2),
+				"megapixels_per_s": round(pixels / total / 1e6, 2),
+				"precision": round(tp / (tp + fp), 4) if tp + fp else 1.0,
+				"recall": round(tp / (tp + fn), 4) if tp + fn else 1.0,
+				}
+			print(f"{mode} @ {threshold}: {result['ms_per_call']}ms/call, {result['calls_per_s']} calls/s, precision {result['precision']}, recall {result['recall']}")
+			results.append(result)
+	return {
+		"corpus_version": manifest["version"],
+		"commit": commit(),
+		"time": time.strftime("%Y-%m-%d %H:%M:%S"),
+		"machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} cpus, opencv {cv2.__version__}",
+		"screens": [c["screenshot"] for c in manifest["cases"]],
+		"results": results,
+		"capture": latency_report() if live_capture else {},
+		}
+
+def save(report, directory=REPORT_DIR):
+	os.makedirs(directory, exist_ok=True)
+	file_name = os.path.join(directory, f"detection-{report['commit']}.json")
+	with open(file_name, "w") as f:
+		json.dump(report, f, indent=4)
+	return file_name
+
+def compare(old_file, new_file):
+	"""Prints how ms per call, precision and recall moved between two saved reports."""
+	with open(old_file) as f:
+		old = {(r["mode"], r["threshold"]): r for r in json.load(f)["results"]}
+	with open(new_file) as f:
+		new = json.load(f)["results"]
+	for r in new:
+		before = old.get((r["mode"], r["threshold"]))
+		if before is None:
+			continue
+		change = (r["ms_per_call"] - before["ms_per_call"]) / before["ms_per_call"] * 100 if before["ms_per_call"] else 0
+		print(f"{r['mode']} @ {r['threshold']}: {before['ms_per_call']} -> {r['ms_per_call']}ms ({change:+.1f}%), precision {before['precision']} -> {r['precision']}, recall {before['recall']} -> {r['recall']}")
+
+def main():
+	report = run_benchmark()
+	print(f"Saved to {save(report)}")
+
+if __name__ == "__main__":
+	main()
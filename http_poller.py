@@ -0,0 +1,208 @@
+import re
+import time
+import threading
+from collections import namedtuple
+from html.parser import HTMLParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib3
+from tracing import span
+
+UNCLAIMED_COLUMN = "待领取"
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+
+BoardState = namedtuple("BoardState", ["count", "cards"])
+Card = namedtuple("Card", ["id", "title"])
+
+class PollError(Exception):
+	"""Raised when the board page could not be fetched or did not look like a board (e.g. session expired)."""
+
+class BoardPageParser(HTMLParser):
+	"""
+	Picks the list count and the cards of the unclaimed column out of a board page.
+	Mirrors what the Selenium path reads: the first 'list-count' element, and every 'card-name'
+	under the great-grandparent of the 'title-name' element reading 待领取.
+	A card's id is the data-id (or id) of the closest element inside the column around its name that has one.
+	"""
+
+	def __init__(self, column_title=UNCLAIMED_COLUMN):
+		super().__init__(convert_charrefs=True)
+		self.column_title = column_title
+		self.count = None
+		self.cards = []
+		self.stack = [] # (class set, id attribute) of currently open elements
+		self.column_depth = None
+		self.column_seen = False
+		self.capture = None # (kind, depth, text parts)
+
+	def handle_starttag(self, tag, attrs):
+		attrs = dict(attrs)
+		classes = set((attrs.get("class") or "").split())
+		if tag not in VOID_TAGS:
+			self.stack.append((classes, attrs.get("data-id") or attrs.get("id")))
+		if self.capture:
+			return
+		if "list-count" in classes and self.count is None:
+			self.capture = ("count", len(self.stack), [])
+		elif "title-name" in classes:
+			self.capture = ("title", len(self.stack), [])
+		elif "card-name" in classes and self.column_depth is not None:
+			self.capture = ("card", len(self.stack), [])
+
+	def handle_endtag(self, tag):
+		if tag in VOID_TAGS or not self.stack:
+			return
+		depth = len(self.stack)
+		if self.capture and self.capture[1] == depth:
+			kind, _, parts = self.capture
+			text = "".join(parts).strip()
+			if kind == "count":
+				digits = re.findall("\\d+", text)
+				if digits:
+					self.count = int(digits[0])
+			elif kind == "title" and text == self.column_title and depth > 3 and not self.column_seen:
+				self.column_depth = depth - 3
+				self.column_seen = True
+			elif kind == "card":
+				card_id = next((el_id for _, el_id in reversed(self.stack[self.column_depth:]) if el_id), None)
+				self.cards.append(Card(card_id, text))
+			self.capture = None
+		if self.column_depth == depth:
+			self.column_depth = None
+		self.stack.pop()
+
+	def handle_data(self, data):
+		if self.capture:
+			self.capture[2].append(data)
+
+def parse_board(html):
+	"""Returns a BoardState parsed from the html of a board page."""
+	parser = BoardPageParser()
+	parser.feed(html)
+	parser.close()
+	if parser.count is None:
+		raise PollError("No list count found on page.")
+
+	#cards without an id are told apart by title, and by position among cards of the same title
+	cards = []
+	seen = {}
+	for card in parser.cards:
+		if card.id is None:
+			n = seen.get(card.title, 0)
+			seen[card.title] = n + 1
+			card = Card(f"{card.title}#{n}", card.title)
+		cards.append(card)
+	return BoardState(parser.count, cards)
+
+def made_up_id(card):
+	"""Whether a card's id was made up from its title (here or in board_dom) because the page gave it none."""
+	return card.id.startswith(f"{card.title}#")
+
+class BoardPoller:
+	"""
+	Polls a TAPD board over a pooled keep-alive HTTP connection.
+	Uses the session cookies of an already logged-in Selenium driver, so each poll only
+	costs one GET instead of a full browser page load.
+	"""
+
+	def __init__(self, url, cookies=None, user_agent=None, timeout=5.0):
+		self.url = url
+		self.lock = threading.Lock()
+		self.http = urllib3.PoolManager(
+			num_pools=2,
+			maxsize=2,
+			block=True,
+			retries=False,
+			timeout=urllib3.Timeout(connect=timeout, read=timeout),
+			)
+		self.headers = {"Connection": "keep-alive"}
+		if user_agent:
+			self.headers["User-Agent"] = user_agent
+		self.set_cookies(cookies or [])
+
+	@classmethod
+	def from_driver(cls, driver, url=None, **kwargs):
+		"""Creates a poller that reuses the session of a logged-in driver."""
+		user_agent = driver.execute_script("return navigator.userAgent")
+		return cls(url or driver.current_url, driver.get_cookies(), user_agent, **kwargs)
+
+	def set_cookies(self, cookies):
+		"""Takes cookies in Selenium's get_cookies() format."""
+		with self.lock:
+			self.headers["Cookie"] = "; ".join(f"{c['name']}={c['value']}" for c in cookies)
+
+	def update_cookies(self, driver):
+		self.set_cookies(driver.get_cookies())
+
+	def fetch(self):
+		with self.lock:
+			headers = dict(self.headers)
+		try:
+			r = self.http.request("GET", self.url, headers=headers, redirect=False)
+		except urllib3.exceptions.HTTPError as e:
+			raise PollError(str(e))
+		if r.status != 200:
+			raise PollError(f"Board returned HTTP {r.status}.")
+		return r.data.decode("utf-8", errors="replace")
+
+	def poll(self):
+		"""Fetches the board and returns its BoardState. Raises PollError on failure."""
+		with span("fetch"):
+			html = self.fetch()
+		with span("parse"):
+			return parse_board(html)
+
+FAKE_BOARD = """<html><body>
+<div class="board">
+	<div class="column"><div class="column-head"><div class="head-left"><span class="title-name">待领取</span></div></div>
+		<span class="list-count">({count})</span>
+		<div class="cards">{cards}</div>
+	</div>
+	<div class="column"><div class="column-head"><div class="head-left"><span class="title-name">已领取</span></div></div>
+		<div class="cards"><div class="card"><span class="card-name">Claimed Movie</span></div></div>
+	</div>
+</div>
+</body></html>"""
+
+def serve_fake_board(cards, port=0):
+	"""
+	Starts a local stand-in for a TAPD board on a background thread.
+	The card list (of titles) can be mutated while the server runs. Returns the server.
+	"""
+	class Handler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+		disable_nagle_algorithm = True
+
+		def do_GET(self):
+			card_html = "".join(f'<div class="card" data-id="{abs(hash(c))}"><span class="card-name">{c}</span></div>' for c in list(cards))
+			body = FAKE_BOARD.format(count=len(cards), cards=card_html).encode("utf-8")
+			self.send_response(200)
+			self.send_header("Content-Type", "text/html; charset=utf-8")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, *args):
+			pass
+
+	server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def main():
+	cards = ["【2】如果可以回到过去【6】自带轴 1080"]
+	server = serve_fake_board(cards)
+	poller = BoardPoller(f"http://127.0.0.1:{server.server_address[1]}/board", [{"name": "tapdsession", "value": "test"}])
+
+	latencies = []
+	for i in range(50):
+		if i == 25:
+			cards.append("【2】男人的争斗【7】英文内嵌 非英文部分不翻1080")
+		t = time.perf_counter()
+		state = poller.poll()
+		latencies.append(time.perf_counter() - t)
+	print(f"Last state: {state}")
+	print(f"Mean poll latency: {round(sum(latencies)/len(latencies)*1000, 2)}ms")
+	server.shutdown()
+
+if __name__ == "__main__":
+	main()
@@ -1,20 +1,158 @@
 from io import BytesIO
+import time
+import hashlib
+import threading
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
 import win32clipboard
 from PIL import Image, ImageDraw, ImageFont
 
-font = ImageFont.truetype('files\\SourceHanSans-Normal.otf', 38)
+FONT_FILE = 'files\\SourceHanSans-Normal.otf'
+FONT_SIZE = 38
+
+@lru_cache(maxsize=None)
+def get_font(size=FONT_SIZE):
+	"""Loads the font the first time an image is made at that size, not when the module is imported."""
+	return ImageFont.truetype(FONT_FILE, size)
+
+@lru_cache(maxsize=4096)
+def measure(text, size=FONT_SIZE):
+	"""Returns (width, height) of a line of text, the same as ImageDraw.textsize()."""
+	left, top, right, bottom = get_font(size).getbbox(text)
+	return right, bottom
+
+@lru_cache(maxsize=1024)
+def render_line(text, size=FONT_SIZE):
+	"""Returns a mask of a line of text as drawn at (0, 0). Titles that come up again are not drawn again."""
+	w, h = measure(text, size)
+	mask = Image.new('L', (max(1, w), max(1, h)))
+	ImageDraw.Draw(mask).text((0, 0), text, font=get_font(size), fill=255)
+	return mask
+
+Payload = namedtuple("Payload", ["key", "text", "png"])
+
+payloads = OrderedDict() # content hash: Payload, most recently used last
+payloads_lock = threading.Lock()
+MAX_PAYLOADS = 8
+MAX_PAGE_ROWS = 30
+MAX_PAGE_HEIGHT = 2000 # px, chat clients shrink taller images until they cannot be read
+clipboard_state = {"key": None, "sequence": None} # what was last copied, and the clipboard's sequence number right after
+
+def send_to_clipboard(clip_type, data):
+	win32clipboard.OpenClipboard()
+	win32clipboard.EmptyClipboard()
+	win32clipboard.SetClipboardData(clip_type, data)
+	win32clipboard.CloseClipboard()
+
+def payload_key(lst, title, user_imgs):
+	digest = hashlib.sha1()
+	for text in [title or ""] + list(lst):
+		digest.update(text.encode("utf-8") + b"\x00")
+	for img in user_imgs or []:
+		if img is None:
+			digest.update(b"\x00")
+			continue
+		digest.update(f"{img.mode}{img.size}".encode("utf-8"))
+		digest.update(img.tobytes())
+	return digest.hexdigest()
+
+def make_payload(lst, title=None, user_imgs=[]):
+	"""
+	Returns the notification for a list as an immutable Payload (key, text, PNG bytes).
+	The image is rendered and encoded once per content; the same list, title and images get the
+	cached payload back. Payloads are kept as PNG, a fraction of the size of the DIB that
+	copy_payload() makes from them, so holding every page of a long list stays cheap.
+	"""
+	key = payload_key(lst, title, user_imgs)
+	with payloads_lock:
+		payload = payloads.get(key)
+		if payload is not None:
+			payloads.move_to_end(key)
+			return payload
+
+	canvas = render_list(lst, title, user_imgs)
+	output = BytesIO()
+	canvas.convert("RGB").save(output, "PNG", compress_level=1)
+	data = output.getvalue()
+	output.close()
+	payload = Payload(key, "\n".join(([title] if title else []) + list(lst)), data)
+
+	with payloads_lock:
+		payloads[key] = payload
+		while len(payloads) > MAX_PAYLOADS:
+			payloads.popitem(last=False)
+	return payload
+
+def to_dib(png):
+	"""Converts PNG bytes to the DIB the clipboard takes (a BMP without its file header)."""
+	output = BytesIO()
+	with Image.open(BytesIO(png)) as img:
+		img.save(output, "BMP")
+	data = output.getvalue()[14:]
+	output.close()
+	return data
+
+def copy_payload(payload):
+	"""
+	Puts a payload's image on the clipboard, unless it is still there from the last copy.
+	Only the page being copied is ever held as a DIB.
+	"""
+	if payload.key == clipboard_state["key"] and win32clipboard.GetClipboardSequenceNumber() == clipboard_state["sequence"]:
+		return
+	send_to_clipboard(win32clipboard.CF_DIB, to_dib(payload.png))
+	clipboard_state["key"] = payload.key
+	clipboard_state["sequence"] = win32clipboard.GetClipboardSequenceNumber()
+
+def paginate(lst, title=None, user_imgs=[], max_rows=MAX_PAGE_ROWS, max_height=MAX_PAGE_HEIGHT):
+	"""
+	Splits a list into pages of at most max_rows items and about max_height pixels, so long
+	lists are sent as several readable images instead of one huge one.
+	Returns [(items, title, user_imgs)] for each page, in order. The title of a split list gets a
+	page number. Pages are only laid out here, each is rendered when it is sent.
+	"""
+	margin = 20
+	space = 10
+	top = 2 * margin + (measure(title)[1] + space if title else 0)
+	pages = []
+	start = 0
+	height = top
+	for i, e in enumerate(lst):
+		row = (96 if user_imgs and user_imgs[i] is not None else measure(e)[1]) + space
+		if i > start and (i - start >= max_rows or height + row > max_height):
+			pages.append((start, i))
+			start = i
+			height = top
+		height += row
+	pages.append((start, len(lst)))
+	if len(pages) == 1:
+		return [(lst, title, user_imgs)]
+	return [
+		(lst[a:b], f"{title or ''} ({n}/{len(pages)})".strip(), user_imgs[a:b] if user_imgs else [])
+		for n, (a, b) in enumerate(pages, 1)
+		]
+
+def make_pages(lst, title=None, user_imgs=[]):
+	"""
+	Renders a list once into the Payloads of its pages, in order. Build these before sending to
+	several windows, so every window pastes the same pages instead of rendering them again.
+	"""
+	return [make_payload(page, page_title, page_imgs) for page, page_title, page_imgs in paginate(lst, title, user_imgs)]
 
 def list_to_image(lst, title=None, user_imgs=[]):
 	"""
 	Takes a list, prints each element onto a canvas, and copies end image to clipboard.
 	Optionally takes a title.
+	Sending the same list to several windows renders it once and copies it once.
 	"""
-	def send_to_clipboard(clip_type, data):
-		win32clipboard.OpenClipboard()
-		win32clipboard.EmptyClipboard()
-		win32clipboard.SetClipboardData(clip_type, data)
-		win32clipboard.CloseClipboard()
+	copy_payload(make_payload(lst, title, user_imgs))
 
+def render_list(lst, title=None, user_imgs=[]):
+	"""
+	Draws the list (and title) onto a canvas, with user_imgs next to the items if given. Returns the canvas.
+	An item whose image is None gets a text-only row.
+	"""
+	if not any(img is not None for img in user_imgs or []):
+		user_imgs = []
 	converted_list = []
 
 	if title:
@@ -26,32 +164,29 @@ def list_to_image(lst, title=None, user_imgs=[]):
 	margin = 20
 	space = 10
 
-	temp_canvas = Image.new('RGB', (0, 0))
-	temp_draw = ImageDraw.Draw(temp_canvas)
-
 	titles = []
 	widths = []
 	heights = []
 
 	for title in converted_list:
-		w, h = temp_draw.textsize(title, font=font)
+		w, h = measure(title)
 		titles.append((title, h))
 		widths.append(w)
 		heights.append(h)
 
 	if user_imgs:
+		rows = [96 if img is not None else h for img, h in zip(user_imgs, heights[1:])]
 		if max(widths[1:]) + 96 < widths[0]:
 			canvas_w = max(widths) + 2 * margin
 		else:
 			canvas_w = max(widths[1:]) + 96 + 2 * margin
-		canvas_h = heights[0] + (len(titles)-1) * (96 + space) + 2 * margin
+		canvas_h = heights[0] + sum(rows) + (len(titles)-1) * space + 2 * margin
 
 	else:
 		canvas_w = max(widths) + 2 * margin
 		canvas_h = sum(heights) + 2 * margin + (len(titles) - 1) * space
 
 	canvas = Image.new('RGB', (canvas_w, canvas_h), color="#FFFFFF")
-	draw = ImageDraw.Draw(canvas)
 
 	x_coord = margin
 	y_coord = margin
@@ -59,26 +194,42 @@ def list_to_image(lst, title=None, user_imgs=[]):
 	if user_imgs:
 		for i, pair in enumerate(titles):
 			title = pair[0]
-			draw.text((x_coord, y_coord), title, font=font, fill="#000000")
+			canvas.paste((0, 0, 0), (x_coord, y_coord), render_line(title))
 			if i == 0:
-				y_coord += h
+				y_coord += pair[1]
 				y_coord += space
 			else:
-				canvas.paste(user_imgs[i-1], (x_coord + max(widths[1:]), y_coord))
-				y_coord += 96
+				if user_imgs[i-1] is not None:
+					canvas.paste(user_imgs[i-1], (x_coord + max(widths[1:]), y_coord))
+				y_coord += rows[i-1]
 				y_coord += space
 	else:
 		for title, h in titles:
-			draw.text((x_coord, y_coord), title, font=font, fill="#000000")
+			canvas.paste((0, 0, 0), (x_coord, y_coord), render_line(title))
 			y_coord += h
 			y_coord += space
 
-	output = BytesIO()
-	canvas.convert("RGB").save(output, "BMP")
-	data = output.getvalue()[14:]
-	output.close()
+	return canvas
 
-	send_to_clipboard(win32clipboard.CF_DIB, data)
+def benchmark(sizes=(10, 100, 1000), repeats=3):
+	"""Times render_list() on lists of card titles, with the caches cold and then warm."""
+	base = [
+	"【2】如果可以回到过去【6】自带轴 1080",
+	"【2】男人的争斗【7】英文内嵌 非英文部分不翻1080",
+	"【1.5】守夜【8】法国悬疑 英文内嵌1080",
+	]
+	for n in sizes:
+		lst = [f"{base[i % len(base)]} #{i}" for i in range(n)]
+		measure.cache_clear()
+		render_line.cache_clear()
+		t = time.perf_counter()
+		render_list(lst, "Claimed:")
+		cold = time.perf_counter() - t
+		t = time.perf_counter()
+		for i in range(repeats):
+			render_list(lst, "Claimed:")
+		warm = (time.perf_counter() - t) / repeats
+		print(f"{n} lines: first render {round(cold*1000, 1)}ms, repeated {round(warm*1000, 1)}ms")
 
 def main():
 	lst = [
@@ -102,6 +253,7 @@ def main():
 	"【1.5】波登湖【6】英内嵌 轴少 芬兰悬疑 1080"]
 
 	list_to_image(lst)
+	# benchmark()
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -1,50 +1,321 @@
 import cv2
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pyautogui
 from random import choice
-from win32gui import GetForegroundWindow, GetWindowRect
+try:
+	import pyautogui
+	from win32gui import GetForegroundWindow, GetWindowRect
+except Exception:
+	pyautogui = None # no desktop (e.g. benchmarks on a headless box), only frames from replay can be matched
+import threading
 import time
 import os
+from screen_capture import get_capture, convert, frames, grab_image
 
-def detect_image(template_file_name, threshold = 0.9):
-	if not os.path.exists(template_file_name):
-		raise FileNotFoundError
-
-	ss = pyautogui.screenshot()
-	img_rgb = cv2.cvtColor(np.array(ss), cv2.COLOR_RGB2BGR)
-	img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY)
-	template = cv2.imread(template_file_name, 0)
-
-	# Store width and height of template in w and h
-	w, h = template.shape[::-1]
-	res = cv2.matchTemplate(img_gray,template,cv2.TM_CCOEFF_NORMED)
-	loc = np.where( res >= threshold )
-	if len(loc[0]) > 0:
-		ranges = [] # (x_min, x_max, y_min, y_max)
-		for pt in zip(*loc[::-1]):
-			ranges.append((pt[0], pt[0] + w, pt[1], pt[1]+h))
-		current_x = list(pyautogui.position())[0]
-		current_y = list(pyautogui.position())[1]
-		return sorted(ranges, key = lambda i: min(abs(i[0]-current_x),abs(i[2]-current_y)))[0] #return the closest detection
+FOREGROUND = "foreground"
+EXHAUSTIVE = "exhaustive"
+PYRAMID = "pyramid"
+MIN_PYRAMID_TEMPLATE = 8 # px, smallest side a downscaled template may have
+THUMBNAIL_SCALE = 8 # frames are shrunk this many times on each side when checking whether the screen changed
 
-	else:
-		return False
+def thumbnail(frame):
+	"""
+	Returns a copy of frame shrunk THUMBNAIL_SCALE times on each side, compared between frames to
+	tell whether the screen changed. It scales with the frame, so a small, mostly white marker
+	still changes it on a 5k or ultrawide screen.
+	"""
+	height, width = frame.shape[:2]
+	size = (max(1, width // THUMBNAIL_SCALE), max(1, height // THUMBNAIL_SCALE))
+	return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+def suppress(xs, ys, scores, w, h, chunk=65536):
+	"""
+	Greedy non-maximum suppression: keeps the best hit, drops every hit closer to it than the
+	template size, and so on down. Returns the kept hits sorted by score, best first.
+	Done on whole arrays rather than hit by hit: hits are bucketed into template-sized cells to
+	find the pairs that are too close (only ever in neighbouring cells), then every round keeps
+	each hit with no undecided better neighbour and drops each hit next to a kept one. The
+	rounds are as many as the longest chain of overlapping hits, not as many as the hits.
+	"""
+	order = np.argsort(-scores, kind="stable")
+	xs, ys, scores = xs[order], ys[order], scores[order]
+	n = len(xs)
+	if n == 0:
+		return xs, ys, scores
+	#cells are padded by one on every side, so a neighbour never wraps to the next row
+	cols = int(xs.max()) // w + 3
+	cell = (ys // h + 1) * cols + xs // w + 1
+	by_cell = np.argsort(cell, kind="stable")
+	sorted_cells = cell[by_cell]
+	worse, better = [], [] # pairs that are too close, by position in score order
+	for start in range(0, n, chunk):
+		i = np.arange(start, min(start + chunk, n))
+		for dy in (-1, 0, 1):
+			for dx in (-1, 0, 1):
+				target = cell[i] + dy * cols + dx
+				lo = np.searchsorted(sorted_cells, target, "left")
+				counts = np.searchsorted(sorted_cells, target, "right") - lo
+				a = np.repeat(i, counts)
+				b = by_cell[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+				close = (b < a) & (np.abs(xs[a] - xs[b]) < w) & (np.abs(ys[a] - ys[b]) < h)
+				worse.append(a[close])
+				better.append(b[close])
+	worse, better = np.concatenate(worse), np.concatenate(better)
+
+	UNDECIDED, KEPT, DROPPED = 0, 1, 2
+	state = np.zeros(n, np.int8)
+	while True:
+		undecided = state == UNDECIDED
+		if not undecided.any():
+			break
+		next_to_kept = np.bincount(worse[state[better] == KEPT], minlength=n) > 0
+		waiting = np.bincount(worse[state[better] == UNDECIDED], minlength=n) > 0
+		state[undecided & next_to_kept] = DROPPED
+		state[undecided & ~next_to_kept & ~waiting] = KEPT
+	keep = state == KEPT
+	return xs[keep], ys[keep], scores[keep]
+
+def peaks(res, threshold, w, h):
+	"""Returns (xs, ys, scores) of the distinct matches in a matchTemplate result, best first."""
+	#each match lights up a blob of hits, only the top of each blob is a candidate
+	local_max = cv2.compare(res, cv2.dilate(res, np.ones((3, 3), np.uint8)), cv2.CMP_EQ)
+	hits = cv2.findNonZero(cv2.bitwise_and(local_max, (res >= threshold).view(np.uint8)))
+	if hits is None:
+		return np.array([], int), np.array([], int), np.array([], np.float32)
+	hits = hits.reshape(-1, 2)
+	xs, ys = hits[:, 0], hits[:, 1]
+	return suppress(xs, ys, res[ys, xs], w, h)
+
+def nearest(xs, ys, w, h, point):
+	"""Returns the index of the match whose centre is closest to point."""
+	dx = xs + w / 2 - point[0]
+	dy = ys + h / 2 - point[1]
+	return int(np.argmin(dx * dx + dy * dy))
+
+class Detection(namedtuple("Detection", "x_min x_max y_min y_max")):
+	"""Screen coords of a match. stamp is the key of the frame it was found in, in screen_capture.frames."""
+	stamp = None
+
+class Detector:
+	"""
+	Finds templates on screen.
+	Templates are decoded to grayscale once and kept in memory. Each detection captures only
+	its region of interest (by default the whole screen, or FOREGROUND for the window in
+	front), and the returned coordinates come from that same capture.
+	In PYRAMID mode the search runs on a downscaled image pyramid first, and only the areas
+	around the coarse peaks that clear coarse_threshold are matched at full resolution.
+	"""
+
+	def __init__(self, mode=EXHAUSTIVE, levels=2, coarse_threshold=0.3, candidates=2000, workers=4):
+		self.templates = {}
+		self.lock = threading.Lock()
+		self.mode = mode
+		self.levels = levels
+		self.coarse_threshold = coarse_threshold
+		self.candidates = candidates # cap on refined areas, so a busy screen cannot cost more than a full search
+		self.workers = workers
+		self.pool = None # started on the first detect_many()
+
+	def template(self, template_file_name):
+		template = self.templates.get(template_file_name)
+		if template is None:
+			if not os.path.exists(template_file_name):
+				raise FileNotFoundError(template_file_name)
+			template = cv2.imread(template_file_name, 0)
+			with self.lock:
+				self.templates[template_file_name] = template
+		return template
+
+	def resolve_region(self, region):
+		"""Turns a region into (left, top, width, height) clipped to the screen, or None for the whole screen."""
+		if region is None:
+			return None
+		if region == FOREGROUND:
+			left, top, right, bottom = GetWindowRect(GetForegroundWindow())
+		else:
+			left, top, width, height = region
+			right, bottom = left + width, top + height
+		screen_w, screen_h = get_capture().size()
+		left, top = max(left, 0), max(top, 0)
+		right, bottom = min(right, screen_w), min(bottom, screen_h)
+		if right <= left or bottom <= top:
+			return None
+		return (left, top, right - left, bottom - top)
+
+	def capture(self, region=None):
+		"""
+		Returns (grayscale frame, (x offset, y offset), stamp) of a region of the screen.
+		The frame as grabbed is kept in screen_capture.frames under stamp.
+		"""
+		region = self.resolve_region(region)
+		cap = get_capture()
+		frame = cap.grab(region)
+		offset = (region[0], region[1]) if region else (0, 0)
+		stamp = frames.put(frame, offset, cap.to_bgr)
+		return convert(frame, cap.to_gray), offset, stamp
+
+	def find(self, img_gray, template, threshold):
+		"""Returns (xs, ys, scores) of the top left corners of the distinct matches scoring at least threshold, best first."""
+		if self.mode == PYRAMID:
+			return self.find_pyramid(img_gray, template, threshold)
+		return self.find_exhaustive(img_gray, template, threshold)
+
+	def find_exhaustive(self, img_gray, template, threshold):
+		res = cv2.matchTemplate(img_gray,template,cv2.TM_CCOEFF_NORMED)
+		h, w = template.shape
+		return peaks(res, threshold, w, h)
+
+	def find_pyramid(self, img_gray, template, threshold):
+		levels = self.levels
+		while levels and min(template.shape) >> levels < MIN_PYRAMID_TEMPLATE:
+			levels -= 1
+		if not levels:
+			return self.find_exhaustive(img_gray, template, threshold)
+
+		small_img, small_template = img_gray, template
+		for i in range(levels):
+			small_img = cv2.pyrDown(small_img)
+			small_template = cv2.pyrDown(small_template)
+		res = cv2.matchTemplate(small_img, small_template, cv2.TM_CCOEFF_NORMED)
+
+		#every local peak of the coarse search that clears the relaxed coarse threshold is refined.
+		#Coarse scores run well below the full resolution ones (downscaling blurs the template's
+		#edges and depends on how a match lines up with the pixel grid), hence the low bar.
+		coarse_peaks = cv2.compare(res, cv2.dilate(res, np.ones((3, 3), np.uint8)), cv2.CMP_EQ)
+		hits = cv2.findNonZero(cv2.bitwise_and(coarse_peaks, (res >= self.coarse_threshold).view(np.uint8)))
+		if hits is None:
+			return np.array([], int), np.array([], int), np.array([], np.float32)
+		hits = hits.reshape(-1, 2)
+		xs, ys = hits[:, 0], hits[:, 1]
+		best = np.argsort(res[ys, xs])[::-1][:self.candidates]
+
+		scale = 2 ** levels
+		pad = scale + 1
+		h, w = template.shape
+		img_h, img_w = img_gray.shape
+		found_xs, found_ys, found_scores = [], [], []
+		for cx, cy in zip(xs[best] * scale, ys[best] * scale):
+			x0, y0 = max(cx - pad, 0), max(cy - pad, 0)
+			x1, y1 = min(cx + w + pad, img_w), min(cy + h + pad, img_h)
+			if x1 - x0 < w or y1 - y0 < h:
+				continue
+			sub_xs, sub_ys, sub_scores = self.find_exhaustive(img_gray[y0:y1, x0:x1], template, threshold)
+			found_xs.append(sub_xs + x0)
+			found_ys.append(sub_ys + y0)
+			found_scores.append(sub_scores)
+		if not found_xs:
+			return np.array([], int), np.array([], int), np.array([], np.float32)
+
+		#refine windows can overlap
+		return suppress(np.concatenate(found_xs), np.concatenate(found_ys), np.concatenate(found_scores), w, h)
+
+	def match_all(self, img_gray, offset, template_file_name, threshold=0.9):
+		"""Matches a template against an already captured frame. Returns [(x_min, x_max, y_min, y_max, score)] in screen coords, best first."""
+		template = self.template(template_file_name)
+
+		# Store width and height of template in w and h
+		w, h = template.shape[::-1]
+		if img_gray.shape[0] < h or img_gray.shape[1] < w:
+			return []
+		xs, ys, scores = self.find(img_gray, template, threshold)
+		xs, ys = xs + offset[0], ys + offset[1]
+		return [(int(x), int(x) + w, int(y), int(y) + h, float(score)) for x, y, score in zip(xs, ys, scores)]
+
+	def match(self, img_gray, offset, template_file_name, threshold=0.9, point=None, stamp=None):
+		"""Like match_all, but returns only the match closest to point (the mouse by default) as a Detection, or False."""
+		template = self.template(template_file_name)
+		w, h = template.shape[::-1]
+		if img_gray.shape[0] < h or img_gray.shape[1] < w:
+			return False
+		xs, ys, scores = self.find(img_gray, template, threshold)
+		if not len(xs):
+			return False
+		if point is None:
+			point = pyautogui.position()
+		i = nearest(xs + offset[0], ys + offset[1], w, h, point)
+		x, y = int(xs[i]) + offset[0], int(ys[i]) + offset[1]
+		detection = Detection(x, x + w, y, y + h)
+		detection.stamp = stamp
+		return detection
+
+	def detect_all(self, template_file_name, threshold=0.9, region=None):
+		self.template(template_file_name)
+		img_gray, offset, stamp = self.capture(region)
+		return self.match_all(img_gray, offset, template_file_name, threshold)
+
+	def detect(self, template_file_name, threshold=0.9, region=None):
+		self.template(template_file_name)
+		img_gray, offset, stamp = self.capture(region)
+		return self.match(img_gray, offset, template_file_name, threshold, stamp=stamp)
+
+	def detect_many(self, template_file_names, threshold=0.9, region=None):
+		"""
+		Looks for several templates in one capture. The templates are matched in parallel (OpenCV
+		releases the GIL while matching) and each gets the match closest to the mouse, as in detect().
+		Returns {template file name: Detection or False}.
+		"""
+		for name in template_file_names:
+			self.template(name)
+		img_gray, offset, stamp = self.capture(region)
+		point = pyautogui.position()
+		with self.lock:
+			if self.pool is None:
+				self.pool = ThreadPoolExecutor(max_workers=self.workers)
+			pool = self.pool
+		results = pool.map(lambda name: self.match(img_gray, offset, name, threshold, point, stamp), template_file_names)
+		return dict(zip(template_file_names, results))
+
+	def wait(self, template_file_name, timeout=5, threshold=0.9, region=None, interval=0.05):
+		"""
+		Waits until a template appears, returning its coords as soon as it is found, or False once
+		timeout seconds have passed. The deadline is on the monotonic clock, so time spent capturing
+		and matching counts towards it. Frames whose thumbnail is the same as the last one
+		checked are not matched again.
+		"""
+		self.template(template_file_name)
+		deadline = time.monotonic() + timeout
+		last = None
+		while True:
+			started = time.monotonic()
+			img_gray, offset, stamp = self.capture(region)
+			small = thumbnail(img_gray)
+			if last is None or not np.array_equal(small, last):
+				last = small
+				result = self.match(img_gray, offset, template_file_name, threshold, stamp=stamp)
+				if result:
+					return result
+			now = time.monotonic()
+			if now >= deadline:
+				return False
+			time.sleep(max(0, min(interval - (now - started), deadline - now)))
+
+detector = Detector()
+
+def detect_image(template_file_name, threshold = 0.9, region=None):
+	return detector.detect(template_file_name, threshold, region)
+
+def detect_images(template_file_names, threshold=0.9, region=None):
+	return detector.detect_many(template_file_names, threshold, region)
+
+def wait_for_image(template_file_name, timeout=5, threshold=0.9, region=None):
+	return detector.wait(template_file_name, timeout, threshold, region)
 
 def crop_full(detected):
+	"""Crops the area around a detection as evidence, from the frame it was detected in while that is still cached."""
 	x_min, x_max, y_min, y_max = detected
-	ss = pyautogui.screenshot()
-	cropped = ss.crop((x_min-80, y_min-50, x_max+100, y_max+15))
+	box = (x_min-80, y_min-50, x_max+100, y_max+15)
+	cropped = frames.crop(getattr(detected, "stamp", None), box)
+	if cropped is None:
+		cropped = grab_image().crop(box)
 	return cropped
 
-def click_image(template_file_name, delay=5, double=False):
-	t = 0
-	while not detect_image(template_file_name):
-		time.sleep(0.1)
-		t += 0.1
-		if t >= delay:
-			print(f"{template_file_name} undetected.")
-			return
-	x1, x2, y1, y2 = detect_image(template_file_name)
+def click_image(template_file_name, delay=5, double=False, region=None):
+	result = wait_for_image(template_file_name, timeout=delay, region=region)
+	if not result:
+		print(f"{template_file_name} undetected.")
+		return
+	x1, x2, y1, y2 = result
 	center_x = (x1 + x2)/2
 	center_y = (y1 + y2)/2
 	pyautogui.moveTo(center_x, center_y)
@@ -55,25 +326,121 @@ def click_image(template_file_name, delay=5, double=False):
 
 	return (center_x, center_y)
 
-def move_to_image(template_file_name, delay=5):
-	t = 0
-	while not detect_image(template_file_name):
-		time.sleep(0.1)
-		t += 0.1
-		if t >= delay:
-			print(f"{template_file_name} undetected.")
-			return
-	x1, x2, y1, y2 = detect_image(template_file_name)
+def move_to_image(template_file_name, delay=5, region=None):
+	result = wait_for_image(template_file_name, timeout=delay, region=region)
+	if not result:
+		print(f"{template_file_name} undetected.")
+		return
+	x1, x2, y1, y2 = result
 	center_x = (x1 + x2)/2
 	center_y = (y1 + y2)/2
 	pyautogui.moveTo(center_x, center_y)
 
 	return (center_x, center_y)
 
+def verify_pyramid(corpus_dir, template_file_name, threshold=0.9, levels=2, tolerance=1):
+	"""
+	Checks that PYRAMID mode finds the same matches as the exhaustive search on every
+	screenshot (.png) in corpus_dir, each within tolerance px. Returns the names of the
+	screenshots where the two sets of matches differ.
+	"""
+	exhaustive = Detector()
+	pyramid = Detector(mode=PYRAMID, levels=levels)
+	template = exhaustive.template(template_file_name)
+
+	def same(a, b):
+		"""Whether every match in a pairs up with a distinct match in b."""
+		unmatched = list(zip(*b[:2]))
+		for x, y in zip(*a[:2]):
+			pair = next((p for p in unmatched if abs(x - p[0]) <= tolerance and abs(y - p[1]) <= tolerance), None)
+			if pair is None:
+				return False
+			unmatched.remove(pair)
+		return not unmatched
+
+	mismatches = []
+	for file_name in sorted(os.listdir(corpus_dir)):
+		if not file_name.endswith(".png"):
+			continue
+		img_gray = cv2.imread(os.path.join(corpus_dir, file_name), 0)
+		if img_gray.shape[0] < template.shape[0] or img_gray.shape[1] < template.shape[1]:
+			continue
+		if not same(exhaustive.find(img_gray, template, threshold), pyramid.find(img_gray, template, threshold)):
+			mismatches.append(file_name)
+	return mismatches
+
+def loop_suppress(xs, ys, scores, w, h):
+	"""The hit by hit greedy suppression that suppress() replaced, kept to benchmark against."""
+	order = np.argsort(-scores, kind="stable")
+	xs, ys, scores = xs[order], ys[order], scores[order]
+	keep = []
+	remaining = np.arange(len(xs))
+	while len(remaining):
+		i = remaining[0]
+		keep.append(i)
+		rest = remaining[1:]
+		remaining = rest[(np.abs(xs[rest] - xs[i]) >= w) | (np.abs(ys[rest] - ys[i]) >= h)]
+	return xs[keep], ys[keep], scores[keep]
+
+def benchmark_peaks(size=(2160, 3840), template_size=(31, 65), repeats=5):
+	"""
+	Times peak extraction against the old list-and-sort of every hit, on dense hit maps:
+	a few matches that each light up a wide blob of hits, a screen full of repeated matches,
+	and a crowded map of small, weak matches. Also times suppress() against suppressing the
+	same local maxima hit by hit.
+	"""
+	h, w = template_size
+	rng = np.random.default_rng(0)
+	yy, xx = np.mgrid[0:size[0] - h + 1, 0:size[1] - w + 1]
+	blobs = np.zeros(yy.shape, np.float32)
+	for i in range(5):
+		cy, cx = rng.integers(0, blobs.shape[0]), rng.integers(0, blobs.shape[1])
+		blobs = np.maximum(blobs, np.exp(-((yy - cy) ** 2 + (xx - cx) ** 2) / (2 * 30.0 ** 2)).astype(np.float32))
+
+	#a smooth pattern tiled over the screen, so every match is a blob of hits
+	tile = cv2.GaussianBlur(rng.integers(0, 255, (h * 2, w * 2), dtype=np.uint8), (0, 0), 3)
+	img_gray = np.tile(tile, (size[0] // tile.shape[0] + 1, size[1] // tile.shape[1] + 1))[:size[0], :size[1]]
+	tiled = cv2.matchTemplate(img_gray, tile[:h, :w], cv2.TM_CCOEFF_NORMED)
+
+	#smoothed noise, as from a small template on a busy screen: thousands of local maxima
+	noise = cv2.GaussianBlur(rng.random((size[0] - 7, size[1] - 7)).astype(np.float32), (0, 0), 1.5)
+	noise = (noise - noise.min()) / (noise.max() - noise.min())
+
+	for name, res, threshold, (th, tw) in (
+		("5 wide matches", blobs, 0.9, (h, w)),
+		("tiled screen", tiled, 0.9, (h, w)),
+		("crowded 8px matches", noise, 0.8, (8, 8)),
+		):
+		t = time.perf_counter()
+		for i in range(repeats):
+			loc = np.where( res >= threshold )
+			ranges = [(pt[0], pt[0] + tw, pt[1], pt[1] + th) for pt in zip(*loc[::-1])]
+			sorted(ranges, key = lambda i: min(abs(i[0]-0),abs(i[2]-0)))[0]
+		old = (time.perf_counter() - t) / repeats
+
+		t = time.perf_counter()
+		for i in range(repeats):
+			xs, ys, scores = peaks(res, threshold, tw, th)
+			nearest(xs, ys, tw, th, (0, 0))
+		new = (time.perf_counter() - t) / repeats
+
+		local_max = cv2.compare(res, cv2.dilate(res, np.ones((3, 3), np.uint8)), cv2.CMP_EQ)
+		hits = cv2.findNonZero(cv2.bitwise_and(local_max, (res >= threshold).view(np.uint8))).reshape(-1, 2)
+		candidates = (hits[:, 0], hits[:, 1], res[hits[:, 1], hits[:, 0]], tw, th)
+		t = time.perf_counter()
+		loop_suppress(*candidates)
+		looped = time.perf_counter() - t
+		t = time.perf_counter()
+		suppress(*candidates)
+		vectorized = time.perf_counter() - t
+
+		print(f"{name}: {len(ranges)} raw hits -> {len(hits)} local maxima -> {len(xs)} matches, list+sort {round(old*1000, 2)}ms, local max + NMS {round(new*1000, 2)}ms (NMS {round(vectorized*1000, 2)}ms, hit by hit {round(looped*1000, 2)}ms)")
+
 def main():
 	# result = click_image("files\\1.png", delay=5)
 	# # crop_full(result).save("cropped.png")
+	# print(verify_pyramid("corpus", "files\\1.png"))
 	move_to_image("automation\\wjcszs1.png")
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
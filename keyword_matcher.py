@@ -0,0 +1,119 @@
+import time
+import random
+from collections import deque
+
+CLAIM = 1
+NO_CLAIM = 2
+SEPARATOR = "\x00"
+
+class KeywordMatcher:
+	"""
+	Decides which card titles to claim, using an Aho-Corasick automaton built from the
+	claim and don't-claim keywords.
+	All titles are classified in a single scan, so the cost grows with the total length of the
+	titles instead of titles x keywords. Pass keywords="all" to claim everything that has no
+	don't-claim keyword.
+	"""
+
+	def __init__(self, keywords, negative_keywords):
+		self.claim_all = keywords == "all"
+		self.goto = [{}]
+		self.fail = [0]
+		self.out = [0] # bitmask of CLAIM/NO_CLAIM for keywords ending at each state
+		if not self.claim_all:
+			for kw in keywords:
+				self.add(kw, CLAIM)
+		for kw in negative_keywords:
+			self.add(kw, NO_CLAIM)
+		self.build()
+
+	def add(self, kw, kind):
+		if not kw:
+			return
+		state = 0
+		for ch in kw:
+			nxt = self.goto[state].get(ch)
+			if nxt is None:
+				nxt = len(self.goto)
+				self.goto[state][ch] = nxt
+				self.goto.append({})
+				self.fail.append(0)
+				self.out.append(0)
+			state = nxt
+		self.out[state] |= kind
+
+	def build(self):
+		"""Computes failure links breadth first and merges outputs along them."""
+		queue = deque(self.goto[0].values())
+		while queue:
+			state = queue.popleft()
+			for ch, nxt in self.goto[state].items():
+				queue.append(nxt)
+				f = self.fail[state]
+				while f and ch not in self.goto[f]:
+					f = self.fail[f]
+				self.fail[nxt] = self.goto[f].get(ch, 0)
+				self.out[nxt] |= self.out[self.fail[nxt]]
+
+	def scan(self, titles):
+		"""Returns the CLAIM/NO_CLAIM bitmask of every title, scanning them all in one pass."""
+		goto = self.goto
+		fail = self.fail
+		out = self.out
+		masks = [0] * len(titles)
+		i = 0
+		state = 0
+		for ch in SEPARATOR.join(titles):
+			if ch == SEPARATOR:
+				i += 1
+				state = 0
+				continue
+			while state and ch not in goto[state]:
+				state = fail[state]
+			state = goto[state].get(ch, 0)
+			if out[state]:
+				masks[i] |= out[state]
+		return masks
+
+	def classify(self, titles):
+		"""Returns whether each title should be claimed."""
+		if self.claim_all:
+			return [not mask & NO_CLAIM for mask in self.scan(titles)]
+		return [mask == CLAIM for mask in self.scan(titles)]
+
+	def matches(self, title):
+		return self.classify([title])[0]
+
+def naive_classify(titles, keywords, negative_keywords):
+	"""The old any(kw in title) check, kept for comparison."""
+	if keywords == "all":
+		return [not any(nkw in t for nkw in negative_keywords) for t in titles]
+	return [any(kw in t for kw in keywords) and not any(nkw in t for nkw in negative_keywords) for t in titles]
+
+def main():
+	"""Micro-benchmark over synthetic card lists."""
+	rng = random.Random(0)
+	chars = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+	def word(n):
+		return "".join(rng.choice(chars) for _ in range(n))
+
+	for n_keywords, n_cards in ((10, 10), (100, 100), (500, 500), (500, 2000)):
+		keywords = [word(rng.randint(2, 4)) for _ in range(n_keywords)]
+		negative_keywords = [word(rng.randint(2, 4)) for _ in range(n_keywords // 5)]
+		titles = [f"【{rng.randint(1, 3)}】{word(rng.randint(3, 8))}【{rng.randint(5, 8)}】{word(rng.randint(4, 12))} 1080" for _ in range(n_cards)]
+
+		t = time.perf_counter()
+		matcher = KeywordMatcher(keywords, negative_keywords)
+		build = time.perf_counter() - t
+		t = time.perf_counter()
+		result = matcher.classify(titles)
+		fast = time.perf_counter() - t
+		t = time.perf_counter()
+		expected = naive_classify(titles, keywords, negative_keywords)
+		naive = time.perf_counter() - t
+		assert result == expected
+
+		print(f"{n_keywords} keywords x {n_cards} cards: build {round(build*1000, 2)}ms, classify {round(fast*1000, 2)}ms, naive {round(naive*1000, 2)}ms, {sum(result)} to claim")
+
+if __name__ == "__main__":
+	main()
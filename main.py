@@ -2,7 +2,6 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import re
 import pyautogui
 import pygetwindow as gw
 import tkinter as tk
@@ -17,9 +16,58 @@ import traceback
 import pyperclip
 from pynput import mouse
 import webbrowser
-from image_copying import list_to_image
-from image_detection import detect_image, crop_full, click_image
-from screen_record import start_record
+from image_copying import make_pages, copy_payload
+from image_detection import detect_image, crop_full, click_image, detector, FOREGROUND, EXHAUSTIVE, PYRAMID
+from screen_record import start_record, PreRoll
+from http_poller import BoardPoller, PollError, parse_board
+from poll_scheduler import PollScheduler
+from multi_board import BoardSession, MultiBoardTracker
+from config_store import store
+from storage import get_backend
+from keyword_matcher import KeywordMatcher
+from card_tracking import ColumnSnapshot
+from board_dom import extract_column
+from claim_api import CommentClaimer, CLAIMED, MISSED
+from claim_executor import ClaimExecutor
+from tracing import tracer, span
+
+HTTP = "HTTP" # board states read by the poller
+DRIVER = "the driver" # board states read from the driver's page
+
+#settings with defaults, editable in Settings > Advanced Settings: save file: (tab title, defaults)
+ADVANCED_SETTINGS = {
+	"poll_settings.json" : ("Polling", {
+		"http_poll" : True,
+		"interval" : 1.0,
+		"jitter" : 0.2,
+		"max_backoff" : 60.0,
+		}),
+	"claim_api_info.json" : ("Claim API", {
+		"enabled" : False,
+		"comment_url" : "",
+		"comments_url" : "",
+		"comment" : "1",
+		}),
+	"claim_settings.json" : ("Claiming", {
+		"workers" : 1,
+		"detection_mode" : EXHAUSTIVE,
+		"pyramid_levels" : 2,
+		}),
+	"record_settings.json" : ("Recording", {
+		"pre_roll" : True,
+		"pre_roll_seconds" : 10,
+		"pre_roll_fps" : 4.0,
+		"pre_roll_scale" : 0.5,
+		"pre_roll_max_mb" : 64,
+		"window_only" : True,
+		"scale" : 1.0,
+		"segment_minutes" : 5,
+		"disk_budget_mb" : 2048,
+		}),
+	}
+SETTING_CHOICES = {
+	"detection_mode" : (EXHAUSTIVE, PYRAMID),
+	}
 
 def login(url, driver, username, password):
 	"""Uses a driver to log onto a TAPD board."""
@@ -36,6 +84,20 @@ def login(url, driver, username, password):
 		login_button = driver.find_element(By.ID, "tcloud_login_button")
 		login_button.click()
 
+def lift_session(url, username, password):
+	"""Logs in with a headless driver just long enough to hand its session over to an HTTP poller."""
+	options = webdriver.ChromeOptions()
+	options.add_argument("--headless")
+	driver = webdriver.Chrome(options=options)
+	try:
+		login(url, driver, username, password)
+		WebDriverWait(driver, 10).until(
+			EC.presence_of_element_located((By.CLASS_NAME, "list-count"))
+		)
+		return BoardPoller.from_driver(driver)
+	finally:
+		driver.quit()
+
 def popupMessage(title, message, windowToClose=None):
 	"""
 	Sends a popup message.
@@ -78,31 +140,35 @@ class ChatWindow:
 		else:
 			self.open = False
 
-	def send(self, msg, times, to_img_list=False, img_title=None, user_imgs=None):
-		window = gw.getWindowsWithTitle(self.title)[0]
-		all_windows = gw.getAllWindows()
-
-		for w in all_windows:
-			w.minimize()
-		window.maximize()
-		pyautogui.moveTo(self.x, self.y)
-		pyautogui.click()
-		if not to_img_list:
-			for i in range(times):
-				pyautogui.write(msg)
-				pyautogui.press('enter')
-		else:
-			if user_imgs and img_title:
-				list_to_image(msg, img_title, user_imgs)
-			elif img_title:
-				list_to_image(msg, img_title) #copies image to clipboard
+	def send(self, msg, times, to_img_list=False, img_title=None, user_imgs=None, pages=None):
+		"""
+		Sends msg, or msg as images if to_img_list is set. pages are the already rendered images
+		of msg (from make_pages), when the same list goes to several windows.
+		"""
+		with span("send", window=self.title, images=to_img_list):
+			window = gw.getWindowsWithTitle(self.title)[0]
+			all_windows = gw.getAllWindows()
+
+			for w in all_windows:
+				w.minimize()
+			window.maximize()
+			pyautogui.moveTo(self.x, self.y)
+			pyautogui.click()
+			if not to_img_list:
+				for i in range(times):
+					pyautogui.write(msg)
+					pyautogui.press('enter')
 			else:
-				list_to_image(msg)
-			for i in range(times):
-				pyautogui.hotkey("ctrl", "v")
-				pyautogui.press('enter')
+				#long lists go out as several images, in order
+				if pages is None:
+					pages = make_pages(msg, img_title, user_imgs)
+				for page in pages:
+					copy_payload(page)
+					for i in range(times):
+						pyautogui.hotkey("ctrl", "v")
+						pyautogui.press('enter')
 
-		window.minimize()
+			window.minimize()
 
 class App(ttk.Frame):
 	"""
@@ -114,6 +180,8 @@ class App(ttk.Frame):
 		ttk.Frame.__init__(self, parent)
 		self.parent = parent
 		self.t = threading.Thread(target=self.track)
+		self.windows_info = None
+		self.auto_claim_info = None
 
 		#variables
 		self.pin = tk.BooleanVar(value=False)
@@ -131,6 +199,10 @@ class App(ttk.Frame):
 		auto_claim_info = Database("auto_claim_info.json")
 		click_coords = Database("click_coords.json")
 		scheduled_shutdown_info = Database("scheduled_shutdown_info.json")
+		poll_settings = load_settings("poll_settings.json")
+		claim_api_info = load_settings("claim_api_info.json")
+		claim_settings = load_settings("claim_settings.json")
+		record_settings = load_settings("record_settings.json")
 
 		errors = []
 		if not login_details.data:
@@ -173,6 +245,15 @@ class App(ttk.Frame):
 		self.close_y_coord = click_coords.data['close_y_coord']
 		self.shutdown_after_claim = scheduled_shutdown_info.data['shutdown_after_claim']
 		self.shutdown_time = scheduled_shutdown_info.data['shutdown_time']
+		self.http_poll = poll_settings.data['http_poll']
+		self.poll_interval = poll_settings.data['interval']
+		self.poll_jitter = poll_settings.data['jitter']
+		self.poll_max_backoff = poll_settings.data['max_backoff']
+		self.claim_api_info = dict(claim_api_info.data)
+		self.claim_workers = claim_settings.data['workers']
+		detector.mode = claim_settings.data['detection_mode']
+		detector.levels = claim_settings.data['pyramid_levels']
+		self.record_settings = dict(record_settings.data)
 		return True
 
 	def start(self):
@@ -206,11 +287,14 @@ class App(ttk.Frame):
 		self.start_button.grid(row=4, column=0, columnspan=3, pady=10)
 
 	def update_to_send(self):
-		"""Updates send list during runtime."""
+		"""Updates send list during runtime. Chat windows are only rebuilt when the settings changed."""
+		windows_info = store.get("windows_info.json")
+		if windows_info is self.windows_info:
+			return
+		self.windows_info = windows_info
 		self.to_send = []
 
-		windows_info = Database("windows_info.json")
-		for name, attrs in windows_info.data.items():
+		for name, attrs in windows_info.items():
 			activated = attrs['activated']
 			if activated:
 				coords = attrs['coords']
@@ -218,21 +302,25 @@ class App(ttk.Frame):
 				self.to_send.append(cw)
 
 	def update_kw_list(self):
-		"""Updates keyword list during runtime."""
-		self.auto_claim_info = Database("auto_claim_info.json")
-		self.all_state = self.auto_claim_info.data["all_state"]
+		"""Updates keyword list during runtime. The keyword matcher is only rebuilt when the settings changed."""
+		auto_claim_info = store.get("auto_claim_info.json")
+		if auto_claim_info is self.auto_claim_info:
+			return
+		self.auto_claim_info = auto_claim_info
+		self.all_state = self.auto_claim_info["all_state"]
 		if self.all_state:
 			self.keywords = "all"
 		else:
-			self.keywords = self.auto_claim_info.data["keywords"]
-		self.negative_keywords = self.auto_claim_info.data["negative_keywords"]
-		self.claim_seq = self.auto_claim_info.data["claim_seq"]
+			self.keywords = self.auto_claim_info["keywords"]
+		self.negative_keywords = self.auto_claim_info["negative_keywords"]
+		self.claim_seq = self.auto_claim_info["claim_seq"]
+		self.matcher = KeywordMatcher(self.keywords, self.negative_keywords)
 
 	def update_scheduled_shutdown(self):
 		"""Updates scheduled shutdown settings during runtime."""
-		scheduled_shutdown_info = Database("scheduled_shutdown_info.json")
-		self.shutdown_after_claim = scheduled_shutdown_info.data['shutdown_after_claim']
-		self.shutdown_time = scheduled_shutdown_info.data['shutdown_time']
+		scheduled_shutdown_info = store.get("scheduled_shutdown_info.json")
+		self.shutdown_after_claim = scheduled_shutdown_info['shutdown_after_claim']
+		self.shutdown_time = scheduled_shutdown_info['shutdown_time']
 
 	def pin_window(self, event):
 		if not self.pin.get():
@@ -251,13 +339,51 @@ class App(ttk.Frame):
 			self.light_label.grid(row=0, column=0, sticky=tk.W)
 
 	def track(self):
-		def get_count(text):
-			pattern = re.compile("\\d+")
-			return int(pattern.findall(text)[0])
+		def selenium_poll():
+			"""Reads the count and cards from the driver's current page in one round trip."""
+			try:
+				WebDriverWait(self.driver, 10).until(
+					EC.presence_of_element_located((By.CLASS_NAME, "list-count"))
+					)
+			finally:
+				html = self.driver.page_source
+			with span("parse"):
+				return parse_board(html)
+
+		def poll_board():
+			"""
+			Gets the current state of the board and where it was read from, HTTP or DRIVER.
+			Polls over HTTP when possible, falls back to a full driver refresh if the poller fails.
+			"""
+			if self.poller:
+				try:
+					return self.poller.poll(), HTTP
+				except PollError as e:
+					print(f"HTTP poll failed, falling back to driver refresh: {e}")
+					with span("driver.refresh"):
+						self.driver.refresh()
+					state = selenium_poll()
+					self.poller.update_cookies(self.driver)
+					return state, DRIVER
+			with span("driver.refresh"):
+				self.driver.refresh()
+			return selenium_poll(), DRIVER
+
+		def check_count(state):
+			"""
+			Returns whether the cards read add up to the list count. Warns when they stop adding up,
+			e.g. when a page lists only some of the cards and new ones could go unnoticed.
+			"""
+			mismatch = (len(state.cards), state.count) if len(state.cards) != state.count else None
+			if mismatch and mismatch != self.count_mismatch:
+				print(f"Found {mismatch[0]} card(s) but the list count is {mismatch[1]}, new cards may be missed.")
+			self.count_mismatch = mismatch
+			return mismatch is None
 
 		self.status.set("Status: Program is launching.")
 		self.start_button.config(state=tk.DISABLED)
 		self.output.set("Logging in...")
+		store.watch()
 
 		try:
 			self.driver = webdriver.Chrome()
@@ -271,21 +397,64 @@ class App(ttk.Frame):
 
 		self.driver.minimize_window()
 		login(self.url, self.driver, self.username, self.password)
+		#the poller takes the board's url and cookies, not the login page's
+		WebDriverWait(self.driver, 10).until(
+			EC.presence_of_element_located((By.CLASS_NAME, "list-count"))
+			)
 		self.output.set("Logged in.")
 		self.status.set(f"Status: Logged into {self.name} account.")
 
-		try:
-			WebDriverWait(self.driver, 10).until(
-				EC.presence_of_element_located((By.CLASS_NAME, "list-count"))
-			)
-		finally:
-			list_count_el = self.driver.find_element(By.CLASS_NAME, 'list-count')
-			initial_count = get_count(list_count_el.text)
+		#the first snapshot has to come from the same page source as the polls diffed against it
+		self.count_mismatch = None
+		self.poller = None
+		if self.http_poll:
+			poller = BoardPoller.from_driver(self.driver)
+			try:
+				state = poller.poll()
+			except PollError as e:
+				print(f"HTTP poll failed, polling through the driver instead: {e}")
+			else:
+				if check_count(state):
+					self.poller = poller
+				else:
+					print("HTTP poll does not list every card, polling through the driver instead.")
+		if not self.poller:
+			state = selenium_poll()
+			check_count(state)
+		last_count = state.count
+		self.snapshot = ColumnSnapshot(state.cards)
+		self.snapshot_source = HTTP if self.poller else DRIVER
+
+		if self.claim_api_info["enabled"] and self.claim_api_info["comment_url"]:
+			self.claimer = CommentClaimer(
+				self.poller or BoardPoller.from_driver(self.driver),
+				self.claim_api_info["comment_url"],
+				self.claim_api_info["comments_url"],
+				self.claim_api_info["comment"],
+				)
+		else:
+			self.claimer = None
+		if self.claim_workers > 1:
+			self.output.set("Opening claim sessions...")
+			self.claim_executor = ClaimExecutor(webdriver.Chrome, self.driver.current_url, self.driver.get_cookies(), self.claim_workers)
+		else:
+			self.claim_executor = None
+
+		if self.record_settings["pre_roll"]:
+			self.pre_roll = PreRoll(
+				seconds=self.record_settings["pre_roll_seconds"],
+				fps=self.record_settings["pre_roll_fps"],
+				scale=self.record_settings["pre_roll_scale"],
+				max_bytes=int(self.record_settings["pre_roll_max_mb"] * 1024 * 1024),
+				).start()
+		else:
+			self.pre_roll = None
 
-		t1 = 0
-		t2 = 0
-		latency = 0
-		latencies = []
+		self.scheduler = PollScheduler(
+			interval=self.poll_interval,
+			jitter=self.poll_jitter,
+			max_backoff=self.poll_max_backoff,
+			)
 
 		while True:
 			if self.shutdown_time:
@@ -294,255 +463,332 @@ class App(ttk.Frame):
 				if now_time >= target_time:
 					os.system("shutdown /s /t 1")
 
+			tracer.clear() #only the poll that found an update goes into the trace
+			self.scheduler.wait()
+			self.scheduler.begin()
 			try:
-				WebDriverWait(self.driver, 10).until(
-					EC.presence_of_element_located((By.CLASS_NAME, "list-count"))
-					)
-			finally:
-				list_count_el = self.driver.find_element(By.CLASS_NAME, 'list-count')
-				unclaimed_count = get_count(list_count_el.text)
-
-				#get latest send list and keyword list
-				self.update_to_send()
-				self.update_kw_list()
-				self.update_scheduled_shutdown()
-
-				#check which ones are still open
+				with span("poll"):
+					state, source = poll_board()
+			except Exception:
+				self.scheduler.failed()
+				traceback.print_exc()
+				continue
+			self.scheduler.succeeded()
+			check_count(state)
+			unclaimed_count = state.count
+			known_ids = set(self.snapshot.cards)
+			if source == self.snapshot_source:
+				added, removed = self.snapshot.update(state.cards)
+			else:
+				#the rendered page and the server html do not list cards the same way, diffing
+				#one against the other would turn the differences into updates
+				print(f"Board read through {source} instead of {self.snapshot_source}, taking a new snapshot.")
+				self.snapshot = ColumnSnapshot(state.cards)
+				self.snapshot_source = source
+				added, removed = [], []
+
+			#get latest send list and keyword list
+			self.update_to_send()
+			self.update_kw_list()
+			self.update_scheduled_shutdown()
+
+			#check which ones are still open
+			for cw in self.to_send:
+				cw.update_status()
+
+			ready = []
+			if not self.to_send:
+				msg = "No target window!"
+			elif not any(cw.open for cw in self.to_send):
+				msg = "No target window open!"
+			else:
 				for cw in self.to_send:
-					cw.update_status()
-
-				ready = []
-				if not self.to_send:
-					msg = "No target window!"
-				elif not any(cw.open for cw in self.to_send):
-					msg = "No target window open!"
-				else:
-					for cw in self.to_send:
-						if cw.open:
-							ready.append(cw)
+					if cw.open:
+						ready.append(cw)
 
-				if ready == self.to_send:
-					self.change_light("green")
-				else:
-					self.change_light("red")
-
-				output = ""
-				if ready:
-					output += f"Windows ready: {', '.join(cw.title for cw in ready)}"
-				else:
-					output += msg
-				output += f"\nCurrent video count: {unclaimed_count}"
-				output += f"\nCurrent refresh delay: {round(latency, 2)}s"
+			if ready == self.to_send:
+				self.change_light("green")
+			else:
+				self.change_light("red")
 
-				if not latencies:
-					avg_lat = 0
+			output = ""
+			if ready:
+				output += f"Windows ready: {', '.join(cw.title for cw in ready)}"
+			else:
+				output += msg
+			output += f"\nCurrent video count: {unclaimed_count}"
+			output += f"\n{self.scheduler.summary()}\n"
+			if not self.keywords:
+				output += "\nAuto-claim off."
+			else:
+				output += f"\nClaim sequence: {self.claim_seq}"
+				if self.keywords == "all":
+					output += "\nWill auto-claim all videos."
 				else:
-					avg_lat = sum(latencies)/len(latencies)
+					kws = ", ".join(kw for kw in self.keywords)
+					output += f"\nWill claim videos with keyword(s): {kws}"
+			if self.keywords and self.negative_keywords:
+				nkws = ", ".join(nkw for nkw in self.negative_keywords)
+				output += f"\nWill not claim videos with keyword(s): {nkws}"
+			output += f"\n\nShutdown After Claiming: {self.shutdown_after_claim}"
+			if self.shutdown_time:
+				output += f"\nScheduled shutdown at {self.shutdown_time} hrs."
+			else:
+				output += f"\nNo scheduled shutdown."
+			self.output.set(output)
+			self.pb.grid(row=3, column=0, columnspan=3, pady=10)
+			self.pb.start()
+
+			if unclaimed_count == 0 and last_count != 0:
+				for cw in ready:
+					cw.send('UNCLAIMED VIDEOS HAVE BEEN CLEARED TO 0. STANDBY FOR UPDATE.', 3)
+			last_count = unclaimed_count
+
+			#only new cards matching the keywords are worth claiming
+			if added and self.keywords:
+				actionable = [c for c, ok in zip(added, self.matcher.classify([c.title for c in added])) if ok]
+			else:
+				actionable = []
+
+			if added and self.keywords and not actionable:
+				print(f"New video(s) not matching keywords: {', '.join(c.title for c in added)}")
+				for cw in ready:
+					cw.send('TAPD HAS BEEN UPDATED. https://www.tapd.cn/43882502', 1)
+			elif added:
+				t3 = datetime.datetime.now()
+				if self.poller:
+					#hand off to selenium, the driver page is stale
+					with span("driver.refresh"):
+						self.driver.refresh()
+					selenium_poll()
+				self.driver.maximize_window()
+				recorder = start_record(
+					self.pre_roll,
+					region=FOREGROUND if self.record_settings["window_only"] else None, #the browser, now in front
+					scale=self.record_settings["scale"],
+					segment_seconds=self.record_settings["segment_minutes"] * 60,
+					budget_bytes=int(self.record_settings["disk_budget_mb"] * 1024 * 1024),
+					)
 
-				output += f"\nAverage refresh delay: {round(avg_lat, 2)}s\n"
-				if not self.keywords:
-					output += "\nAuto-claim off."
-				else:
-					output += f"\nClaim sequence: {self.claim_seq}"
+				def get_to_click():
+					self.driver.switch_to.default_content()
+					#cards that were already there before this update are not new
+					found_cards = [c for c in extract_column(self.driver) if c.id not in known_ids]
+					total_indexes = len(found_cards)
+					claimable = self.matcher.classify([c.title for c in found_cards])
+					to_click = [c for c, ok in zip(found_cards, claimable) if ok]
 					if self.keywords == "all":
-						output += "\nWill auto-claim all videos."
+						if self.claim_seq == "Bottom to Top":
+							to_click.reverse()
+						elif self.claim_seq == "Top to Bottom" or self.claim_seq == "Auto":
+							pass
 					else:
-						kws = ", ".join(kw for kw in self.keywords)
-						output += f"\nWill claim videos with keyword(s): {kws}"
-				if self.keywords and self.negative_keywords:
-					nkws = ", ".join(nkw for nkw in self.negative_keywords)
-					output += f"\nWill not claim videos with keyword(s): {nkws}"
-				output += f"\n\nShutdown After Claiming: {self.shutdown_after_claim}"
-				if self.shutdown_time:
-					output += f"\nScheduled shutdown at {self.shutdown_time} hrs."
-				else:
-					output += f"\nNo scheduled shutdown."
-				self.output.set(output)
-				self.pb.grid(row=3, column=0, columnspan=3, pady=10)
-				self.pb.start()
-
-				if unclaimed_count != initial_count:
-					if unclaimed_count == 0:
-						for cw in ready:
-							cw.send('UNCLAIMED VIDEOS HAVE BEEN CLEARED TO 0. STANDBY FOR UPDATE.', 3)
-					elif unclaimed_count > initial_count:
-						recorder = start_record()
-						t3 = datetime.datetime.now()
-						self.driver.maximize_window()
-
-						def get_to_click():
-							to_click = []
-							self.driver.switch_to.default_content()
-							sections = self.driver.find_elements(By.CLASS_NAME, "title-name")
-							for x in sections:
-								if x.text == "待领取":
-									main_box_el = x.find_element(By.XPATH, "..").find_element(By.XPATH, "..").find_element(By.XPATH, "..")
-									found_elements = main_box_el.find_elements(By.CLASS_NAME, "card-name")
-									total_indexes = len(found_elements)
-							if self.keywords == "all":
-								to_click = [e for e in found_elements if not any(nkw in e.text for nkw in self.negative_keywords)]
-								if self.claim_seq == "Bottom to Top":
-									to_click.reverse()
-								elif self.claim_seq == "Top to Bottom" or self.claim_seq == "Auto":
-									pass
-							else:
-								indexes = []
-								for e in found_elements:
-									if any(kw in e.text for kw in self.keywords) and not any(nkw in e.text for nkw in self.negative_keywords):
-										to_click.append(e)
-										indx = found_elements.index(e)
-										indexes.append(indx)
-								if self.claim_seq == "Auto": #auto determine sequence
-									in_first_half = sum(1 for i in indexes if i < total_indexes/2)
-									in_second_half = sum(1 for i in indexes if i >= total_indexes/2)
-									if in_second_half > in_first_half:
-										to_click.reverse()
-								elif self.claim_seq == "Bottom to Top":
-									to_click.reverse()
-								elif self.claim_seq == "Top to Bottom":
-									pass
-
-							return to_click
-
-						#auto claim
-						def add_comment():
-							pyautogui.moveTo(self.comment_x_coord, self.comment_y_coord)
-							pyautogui.click()
-							pyautogui.press("1")
-							pyautogui.press("enter")
-
-						def close_comment():
-							pyautogui.moveTo(self.close_x_coord, self.close_y_coord)
-							pyautogui.click()
-
-						#testing purposes
-						# def add_movie(name):
-						# 	try:
-						# 		add_button = WebDriverWait(self.driver, 10).until(
-						# 			EC.element_to_be_clickable((By.CLASS_NAME, "add-card-placeholder"))
-						# 		)
-						# 	finally:
-						# 		add_button.click()
-						# 	try:
-						# 		comment_box = WebDriverWait(self.driver, 10).until(
-						# 			EC.element_to_be_clickable((By.CLASS_NAME, "control-add-card"))
-						# 		)
-						# 	finally:
-						# 		comment_box.click()
-						# 	pyperclip.copy(name)
-						# 	pyautogui.hotkey("ctrl", "v")
-						# 	pyautogui.press("enter")
-						# 	click_image("cancel.png")
-
-						timings = {}
-						loop_times = 0
-
-						if self.keywords:
-							missed = []
-							user_imgs = []
-							claimed = []
-
-							while True:
-								to_click = get_to_click()
-								if all(e.text in claimed+missed for e in to_click) and len(to_click) <= len(claimed)+len(missed):
-									break
-								elif claimed or missed:
-									to_click = [e for e in to_click if (e.text not in claimed and e.text not in missed)]
-									print(f"On loop {loop_times+1}, new videos: {', '.join(e.text for e in to_click)} were added.")
-
-								loop_times += 1
-
-								for e in to_click:
-									e.click()
-									try:
-										WebDriverWait(self.driver, 10).until(
-										EC.element_to_be_clickable((By.CLASS_NAME, "editor-area"))
-										)
-									finally:
-										result = detect_image("files\\1.png")
-										if result:
-											missed.append(e.text)
-											user_imgs.append(crop_full(result))
-										else:
-											add_comment()
-											claimed.append(e.text)
-										close_comment()
-
-								timings[loop_times] = datetime.datetime.now()
-								self.driver.refresh()
-
-							t4 = timings[loop_times]
-							print(f"Loops: {loop_times}")
-
-						self.output.set("TAPD has been updated!")
-						for cw in ready:
-							cw.send('TAPD HAS BEEN UPDATED. https://www.tapd.cn/43882502', 1)
-
-						output = ""
-						if claimed:
-							for cw in ready:
-								cw.send(claimed, 1, to_img_list=True, img_title=f"Claimed {len(claimed)} video(s):")
-							output = f"Detected update at {t3.strftime('%H:%M:%S')}hrs.\nClaimed {len(claimed)} video(s) in {round((t4-t3).total_seconds(), 2)}s.\n"
-						if missed:
-							for cw in ready:
-								cw.send(missed, 1, to_img_list=True, img_title=f"Did not claim the following {len(missed)} video(s) because someone else commented:", user_imgs=user_imgs)
-							output += f"Missed {len(missed)} video(s)."
-
-						if output:
-							self.output.set(output)
-
-						self.pb.stop()
-						self.status.set("Status: Program has finished.")
-
-						gw.getWindowsWithTitle(self.driver.title)[0].maximize()
-						recorder.stop()
-
-						if self.shutdown_after_claim:
-							time.sleep(10)
-							os.system("shutdown /s /t 1")
-						else:
-							exit()
+						indexes = [i for i, ok in enumerate(claimable) if ok]
+						if self.claim_seq == "Auto": #auto determine sequence
+							in_first_half = sum(1 for i in indexes if i < total_indexes/2)
+							in_second_half = sum(1 for i in indexes if i >= total_indexes/2)
+							if in_second_half > in_first_half:
+								to_click.reverse()
+						elif self.claim_seq == "Bottom to Top":
+							to_click.reverse()
+						elif self.claim_seq == "Top to Bottom":
+							pass
+
+					return to_click
+
+				#auto claim
+				def add_comment():
+					with span("add_comment"):
+						pyautogui.moveTo(self.comment_x_coord, self.comment_y_coord)
+						pyautogui.click()
+						pyautogui.press("1")
+						pyautogui.press("enter")
+
+				def close_comment():
+					with span("close_comment"):
+						pyautogui.moveTo(self.close_x_coord, self.close_y_coord)
+						pyautogui.click()
+
+				def gui_claim():
+					"""Claims the card whose popup is open in front. Returns (result, evidence)."""
+					with span("detect_image"):
+						result = detect_image("files\\1.png", region=FOREGROUND) #only the browser window
+					if result:
+						with span("crop_full"):
+							evidence = crop_full(result)
+						close_comment()
+						return MISSED, evidence
+					add_comment()
+					close_comment()
+					return CLAIMED, None
+
+				#testing purposes
+				# def add_movie(name):
+				# 	try:
+				# 		add_button = WebDriverWait(self.driver, 10).until(
+				# 			EC.element_to_be_clickable((By.CLASS_NAME, "add-card-placeholder"))
+				# 		)
+				# 	finally:
+				# 		add_button.click()
+				# 	try:
+				# 		comment_box = WebDriverWait(self.driver, 10).until(
+				# 			EC.element_to_be_clickable((By.CLASS_NAME, "control-add-card"))
+				# 		)
+				# 	finally:
+				# 		comment_box.click()
+				# 	pyperclip.copy(name)
+				# 	pyautogui.hotkey("ctrl", "v")
+				# 	pyautogui.press("enter")
+				# 	click_image("cancel.png")
+
+				timings = {}
+				loop_times = 0
+
+				missed = []
+				user_imgs = []
+				claimed = []
+				if self.keywords:
+					done = set() #ids of the cards claimed or missed so far
+
+					while True:
+						with span("get_to_click", loop=loop_times+1):
+							to_click = [c for c in get_to_click() if c.id not in done]
+						if not to_click:
+							break
+						elif done:
+							print(f"On loop {loop_times+1}, new videos: {', '.join(c.title for c in to_click)} were added.")
+						done.update(c.id for c in to_click) #every card is claimed or missed by the end of the pass
+
+						loop_times += 1
+
+						if self.claimer:
+							#claim over http first, whatever fails goes through the popup below
+							with span("claim_api", cards=len(to_click)):
+								results = self.claimer.claim_all(to_click)
+							for c in to_click:
+								if results[c.id] == CLAIMED:
+									claimed.append(c.title)
+								elif results[c.id] == MISSED:
+									missed.append(c.title)
+									user_imgs.append(None) #no screenshot to show, the row is text only
+							to_click = [c for c in to_click if results[c.id] is None]
+
+						if self.claim_executor and to_click:
+							with span("claim_executor", cards=len(to_click)):
+								executed = self.claim_executor.claim(to_click, gui_claim)
+							for c, result, evidence in executed:
+								if result == CLAIMED:
+									claimed.append(c.title)
+								elif result == MISSED:
+									missed.append(c.title)
+									user_imgs.append(evidence)
+							#cards a worker session could not open go through the main driver below,
+							#so every card is resolved on this pass and the loop can end
+							to_click = [c for c, result, evidence in executed if result is None]
+							if to_click:
+								self.driver.maximize_window()
+
+						for c in to_click:
+							with span("click", card=c.title):
+								c.element.click()
+							try:
+								with span("editor-area wait", card=c.title):
+									WebDriverWait(self.driver, 10).until(
+									EC.element_to_be_clickable((By.CLASS_NAME, "editor-area"))
+									)
+							finally:
+								result, evidence = gui_claim()
+								if result == MISSED:
+									missed.append(c.title)
+									user_imgs.append(evidence)
+								else:
+									claimed.append(c.title)
+
+						timings[loop_times] = datetime.datetime.now()
+						with span("driver.refresh"):
+							self.driver.refresh()
+
+					if loop_times:
+						t4 = timings[loop_times]
 					else:
-						initial_count = unclaimed_count
-
-				self.driver.refresh()
+						#already gone by the time the driver page loaded, or not claimable after all
+						t4 = datetime.datetime.now()
+						print("No new video(s) left to claim.")
+					print(f"Loops: {loop_times}")
 
-				t2 = datetime.datetime.now()
+				self.output.set("TAPD has been updated!")
+				for cw in ready:
+					cw.send('TAPD HAS BEEN UPDATED. https://www.tapd.cn/43882502', 1)
 
-				if t1 == 0:
-					t1 = t2
+				output = ""
+				if claimed:
+					pages = make_pages(claimed, f"Claimed {len(claimed)} video(s):") #rendered once for all windows
+					for cw in ready:
+						cw.send(claimed, 1, to_img_list=True, pages=pages)
+					output = f"Detected update at {t3.strftime('%H:%M:%S')}hrs.\nClaimed {len(claimed)} video(s) in {round((t4-t3).total_seconds(), 2)}s.\n"
+				if missed:
+					pages = make_pages(missed, f"Did not claim the following {len(missed)} video(s) because someone else commented:", user_imgs)
+					for cw in ready:
+						cw.send(missed, 1, to_img_list=True, pages=pages)
+					output += f"Missed {len(missed)} video(s)."
+
+				if output:
+					self.output.set(output)
+
+				trace_file = os.path.join("traces", f"claim-{t3.strftime('%Y%m%d-%H%M%S')}.json")
+				print(f"Exported {tracer.export(trace_file)} spans to {trace_file}")
+
+				self.pb.stop()
+				self.status.set("Status: Program has finished.")
+
+				gw.getWindowsWithTitle(self.driver.title)[0].maximize()
+				recorder.stop()
+				if self.pre_roll:
+					self.pre_roll.stop()
+				if self.claim_executor:
+					self.claim_executor.quit()
+
+				if self.shutdown_after_claim:
+					time.sleep(10)
+					os.system("shutdown /s /t 1")
 				else:
-					latency = (t2-t1).total_seconds()
-					latencies.append(latency)
-					if len(latencies) > 10:
-						latencies = latencies[:-10]
-					t1 = t2
+					exit()
+
 
 class Database:
 	"""
 	Easily creates and manages save files.
 	Will create file if it does not exist.
 	Save file easily save() method.
+	Where the data actually lives is up to the storage backend (see storage.py).
 	"""
 
 	def __init__(self, save_file):
-		self.path = f"files\\{save_file}"
+		self.save_file = save_file
+		self.backend = get_backend()
 		self.load()
 
 	def load(self):
-		try:
-			with open(self.path, "r") as f:
-				self.data = json.load(f)
-		except FileNotFoundError:
-			if "files" not in os.listdir():
-				os.mkdir("files")
-			with open(self.path, "w") as f:
-				self.data = {}
-				json.dump(self.data, f)
+		text = self.backend.read(self.save_file)
+		if text is None:
+			self.data = {}
+			self.backend.write(self.save_file, json.dumps(self.data))
+		else:
+			self.data = json.loads(text)
 
 	def save(self):
-		with open(self.path, "w") as f:
-			json.dump(self.data, f, indent=4)
+		text = json.dumps(self.data, indent=4)
+		self.backend.write(self.save_file, text)
+		store.push(self.save_file, self.data, text)
+
+def load_settings(save_file):
+	"""Returns the Database of one of the ADVANCED_SETTINGS, with any missing defaults filled in and saved."""
+	settings = Database(save_file)
+	defaults = ADVANCED_SETTINGS[save_file][1]
+	if any(k not in settings.data for k in defaults):
+		settings.data = {**defaults, **settings.data}
+		settings.save()
+	return settings
 
 class LoginDetails:
 	"""Stores login details for TAPD."""
@@ -1160,6 +1406,201 @@ class TestRun:
 			t.start()
 			self.t.destroy()
 
+class MultiBoard:
+	"""
+	Tracks several login presets at once from this one process.
+	Each board costs one HTTP session; updates are sent to the activated windows.
+	Keywords left blank fall back to the Auto Claim settings.
+	"""
+
+	def __init__(self):
+		self.t = tk.Toplevel()
+		self.t.resizable(False, False)
+		self.t.protocol("WM_DELETE_WINDOW", self.close)
+		self.tracker = None
+		self.send_lock = threading.Lock()
+		self.refs = {}
+		self.load()
+		self.setup_widgets()
+
+	def load(self):
+		self.login_details = Database("login_details.json")
+		self.auto_claim_info = Database("auto_claim_info.json")
+
+	def setup_widgets(self):
+		l = ttk.Label(self.t, text="Select boards to track. Separate keywords with commas.")
+		kw_label = ttk.Label(self.t, text="Claim keywords")
+		nkw_label = ttk.Label(self.t, text="Don't claim keywords")
+
+		l.grid(row=0, column=0, columnspan=3, padx=10, pady=10)
+		kw_label.grid(row=1, column=1, padx=10)
+		nkw_label.grid(row=1, column=2, padx=10)
+
+		r = 2
+		for name, attrs in self.login_details.data.items():
+			cb_var = tk.BooleanVar(value=attrs.get("tracked", False))
+			cb = ttk.Checkbutton(self.t, text=name, variable=cb_var, style="Switch.TCheckbutton")
+			kw_entry = ttk.Entry(self.t, width=20)
+			nkw_entry = ttk.Entry(self.t, width=20)
+			kw_entry.insert(0, ", ".join(attrs.get("keywords", [])))
+			nkw_entry.insert(0, ", ".join(attrs.get("negative_keywords", [])))
+
+			#saving references to widgets
+			self.refs[name] = {
+			"cb_var" : cb_var,
+			"kw_entry" : kw_entry,
+			"nkw_entry" : nkw_entry,
+			}
+
+			cb.grid(row=r, column=0, padx=10, pady=10, sticky=tk.W)
+			kw_entry.grid(row=r, column=1, padx=10, pady=10)
+			nkw_entry.grid(row=r, column=2, padx=10, pady=10)
+			r += 1
+
+		self.status = tk.StringVar(value="Not tracking.")
+		self.status_label = ttk.Label(self.t, textvariable=self.status, borderwidth=10, relief="groove")
+		self.start_button = ttk.Button(self.t, text="Start", command=self.start)
+
+		self.status_label.grid(row=r, column=0, columnspan=3, padx=10, pady=10)
+		self.start_button.grid(row=r+1, column=0, columnspan=3, padx=10, pady=10)
+
+	def save(self):
+		def split(text):
+			return [kw.strip() for kw in text.split(",") if kw.strip()]
+
+		for name, refs in self.refs.items():
+			self.login_details.data[name]["tracked"] = refs["cb_var"].get()
+			self.login_details.data[name]["keywords"] = split(refs["kw_entry"].get())
+			self.login_details.data[name]["negative_keywords"] = split(refs["nkw_entry"].get())
+		self.login_details.save()
+
+	def start(self):
+		self.save()
+		selected = [name for name in self.login_details.data if self.login_details.data[name]["tracked"]]
+		if not selected:
+			popupMessage("Error", "Please select at least one board.")
+			return
+		self.start_button.config(state=tk.DISABLED)
+		self.status.set("Logging in...")
+		t = threading.Thread(target=self.run, args=(selected,), daemon=True)
+		t.start()
+
+	def run(self, selected):
+		if self.auto_claim_info.data.get("all_state"):
+			default_keywords = "all"
+		else:
+			default_keywords = self.auto_claim_info.data.get("keywords", [])
+		default_negative_keywords = self.auto_claim_info.data.get("negative_keywords", [])
+
+		self.tracker = MultiBoardTracker(self.notify)
+		for name in selected:
+			attrs = self.login_details.data[name]
+			url = f"https://www.tapd.cn/{attrs['tapd_id']}"
+			self.status.set(f"Logging into {name}...")
+			try:
+				poller = lift_session(url, attrs['username'], attrs['password'])
+			except Exception:
+				traceback.print_exc()
+				popupMessage("Error", f"Could not log into {name}.")
+				continue
+			keywords = attrs["keywords"] or default_keywords
+			negative_keywords = attrs["negative_keywords"] or default_negative_keywords
+			self.tracker.add(BoardSession(name, url, poller, keywords, negative_keywords))
+		self.tracker.start()
+		self.refresh()
+
+	def refresh(self):
+		if self.tracker:
+			self.status.set(self.tracker.status())
+			self.t.after(1000, self.refresh)
+
+	def notify(self, board, new, matching):
+		windows_info = Database("windows_info.json")
+		ready = []
+		for name, attrs in windows_info.data.items():
+			if attrs['activated']:
+				cw = ChatWindow(name, attrs['coords'])
+				cw.update_status()
+				if cw.open:
+					ready.append(cw)
+
+		#sending moves the mouse, so only one board may send at a time
+		with self.send_lock:
+			pages = make_pages(matching, f"{board.name}: {len(matching)} new video(s) matching keywords:") if matching else None
+			for cw in ready:
+				cw.send(f'TAPD BOARD {board.name} HAS BEEN UPDATED. {board.url}', 1)
+				if matching:
+					cw.send(matching, 1, to_img_list=True, pages=pages)
+
+	def close(self):
+		if self.tracker:
+			self.tracker.stop()
+			self.tracker = None
+		self.t.destroy()
+
+class AdvancedSettings:
+	"""
+	Edits polling, claim API, claiming and recording settings, one tab each.
+	Changes take effect the next time tracking starts.
+	"""
+
+	def __init__(self):
+		self.t = tk.Toplevel()
+		self.t.resizable(False, False)
+		self.refs = {}
+		self.load()
+		self.setup_widgets()
+
+	def load(self):
+		self.settings = {save_file: load_settings(save_file) for save_file in ADVANCED_SETTINGS}
+
+	def setup_widgets(self):
+		notebook = ttk.Notebook(self.t)
+		for save_file, (title, defaults) in ADVANCED_SETTINGS.items():
+			tab = ttk.Frame(notebook)
+			notebook.add(tab, text=title)
+			data = self.settings[save_file].data
+			for r, (key, default) in enumerate(defaults.items()):
+				l = ttk.Label(tab, text=key.replace("_", " ").capitalize())
+				if isinstance(default, bool):
+					var = tk.BooleanVar(value=data[key])
+					w = ttk.Checkbutton(tab, variable=var, style="Switch.TCheckbutton")
+				elif key in SETTING_CHOICES:
+					var = tk.StringVar(value=data[key])
+					w = ttk.Combobox(tab, textvariable=var, values=SETTING_CHOICES[key], state="readonly", width=28)
+				else:
+					var = tk.StringVar(value=str(data[key]))
+					w = ttk.Entry(tab, textvariable=var, width=30)
+
+				#saving references to widgets
+				self.refs[(save_file, key)] = var
+
+				l.grid(row=r, column=0, padx=10, pady=5, sticky=tk.W)
+				w.grid(row=r, column=1, padx=10, pady=5, sticky=tk.W)
+		b = ttk.Button(self.t, text="Save", command=self.save)
+
+		notebook.grid(row=0, column=0, padx=10, pady=10)
+		b.grid(row=1, column=0, padx=10, pady=10)
+
+	def save(self):
+		errors = []
+		for (save_file, key), var in self.refs.items():
+			default = ADVANCED_SETTINGS[save_file][1][key]
+			value = var.get()
+			if isinstance(default, (int, float)) and not isinstance(default, bool):
+				try:
+					value = type(default)(value)
+				except ValueError:
+					errors.append(f"{ADVANCED_SETTINGS[save_file][0]}: {key} must be a{'n integer' if isinstance(default, int) else ' number'}.")
+					continue
+			self.settings[save_file].data[key] = value
+		if errors:
+			popupMessage("Error(s)", "\n\n".join(errors))
+			return
+		for settings in self.settings.values():
+			settings.save()
+		popupMessage("Successful", "Saved. Changes take effect the next time tracking starts.", windowToClose=self.t)
+
 class ScheduledShutdown:
 	def __init__(self):
 		self.t = tk.Toplevel()
@@ -1228,6 +1669,8 @@ def main():
 	settings_menu.add_command(label="Click Coords", command=ClickCoords)
 	settings_menu.add_command(label="Test Run", command=TestRun)
 	settings_menu.add_command(label="Scheduled Shutdown", command=ScheduledShutdown)
+	settings_menu.add_command(label="Multi-Board Tracking", command=MultiBoard)
+	settings_menu.add_command(label="Advanced Settings", command=AdvancedSettings)
 	settings_menu.add_command(label="About", command=About)
 
 	root.update()
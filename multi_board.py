@@ -0,0 +1,100 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http_poller import PollError
+from poll_scheduler import PollScheduler
+from keyword_matcher import KeywordMatcher
+from card_tracking import ColumnSnapshot
+
+class BoardSession:
+	"""
+	One tracked board.
+	Holds the board's HTTP poller, its own keyword rules and scheduler, and the last state seen.
+	"""
+
+	def __init__(self, name, url, poller, keywords, negative_keywords, scheduler=None):
+		self.name = name
+		self.url = url
+		self.poller = poller
+		self.keywords = keywords
+		self.negative_keywords = negative_keywords
+		self.matcher = KeywordMatcher(keywords, negative_keywords)
+		self.scheduler = scheduler or PollScheduler()
+		self.in_flight = False
+		self.count = None
+		self.snapshot = ColumnSnapshot()
+		self.error = None
+
+	def poll(self):
+		"""Polls once. Returns (new card titles, new card titles matching the keywords) if cards were added, else None."""
+		self.scheduler.begin()
+		try:
+			state = self.poller.poll()
+		except PollError as e:
+			self.scheduler.failed()
+			self.error = str(e)
+			return None
+		self.scheduler.succeeded()
+		self.error = None
+
+		change = None
+		added, removed = self.snapshot.update(state.cards)
+		if self.count is not None and added:
+			new = [c.title for c in added]
+			change = (new, [t for t, ok in zip(new, self.matcher.classify(new)) if ok])
+		self.count = state.count
+		return change
+
+	def status(self):
+		if self.error:
+			return f"{self.name}: error ({self.error})"
+		if self.count is None:
+			return f"{self.name}: waiting for first poll"
+		p50 = round(self.scheduler.stats()["p50"] * 1000)
+		return f"{self.name}: {self.count} unclaimed (p50 {p50}ms)"
+
+class MultiBoardTracker:
+	"""
+	Tracks several boards from one process.
+	Polls are dispatched to a shared worker pool as each board becomes due, so a slow board
+	does not hold up the others. on_update(board, new, matching) is called from a worker thread.
+	"""
+
+	def __init__(self, on_update, workers=4):
+		self.on_update = on_update
+		self.boards = []
+		self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="board")
+		self.stopped = threading.Event()
+		self.t = threading.Thread(target=self.run, daemon=True)
+
+	def add(self, board):
+		self.boards.append(board)
+
+	def start(self):
+		self.t.start()
+
+	def stop(self):
+		self.stopped.set()
+		self.pool.shutdown(wait=False)
+
+	def run(self):
+		while not self.stopped.is_set():
+			for board in self.boards:
+				if not board.in_flight and board.scheduler.due():
+					board.in_flight = True
+					self.pool.submit(self.poll_board, board)
+			self.stopped.wait(0.05)
+
+	def poll_board(self, board):
+		try:
+			change = board.poll()
+			if change:
+				self.on_update(board, *change)
+		except Exception:
+			traceback.print_exc()
+		finally:
+			board.in_flight = False
+
+	def status(self):
+		"""Combined status of all boards, one line each."""
+		return "\n".join(b.status() for b in self.boards)
@@ -0,0 +1,112 @@
+import time
+import random
+import threading
+from collections import deque
+
+class PollScheduler:
+	"""
+	Paces the tracking loop.
+	Waits a target interval (plus or minus some jitter) between polls, backs off exponentially
+	while polls keep failing, and keeps a ring buffer of the latest poll durations so tail
+	latency can be shown instead of only an average.
+	"""
+
+	def __init__(self, interval=1.0, jitter=0.2, max_backoff=60.0, window=256):
+		self.interval = interval
+		self.jitter = jitter
+		self.max_backoff = max_backoff
+		self.durations = deque(maxlen=window)
+		self.lock = threading.Lock()
+		self.errors = 0 # consecutive
+		self.total_polls = 0
+		self.total_errors = 0
+		self.last_start = None
+		self.next_due = None
+		self.started = None
+
+	def next_delay(self):
+		"""Returns how long to wait between the start of the last poll and the next one."""
+		if self.errors:
+			delay = min(self.interval * 2 ** self.errors, self.max_backoff)
+		else:
+			delay = self.interval
+		if self.jitter:
+			delay += random.uniform(-self.jitter, self.jitter)
+		return max(delay, 0)
+
+	def due(self):
+		return self.next_due is None or time.monotonic() >= self.next_due
+
+	def wait(self):
+		"""Sleeps until the next poll is due. Time already spent since the last poll counts towards the wait."""
+		if self.next_due is None:
+			return
+		remaining = self.next_due - time.monotonic()
+		if remaining > 0:
+			time.sleep(remaining)
+
+	def begin(self):
+		self.started = time.perf_counter()
+		self.last_start = time.monotonic()
+
+	def succeeded(self):
+		self.record(False)
+
+	def failed(self):
+		self.record(True)
+
+	def record(self, error):
+		duration = time.perf_counter() - self.started
+		with self.lock:
+			self.durations.append(duration)
+			self.total_polls += 1
+			if error:
+				self.errors += 1
+				self.total_errors += 1
+			else:
+				self.errors = 0
+			self.next_due = self.last_start + self.next_delay()
+
+	def stats(self):
+		"""Returns the last duration, p50, p95, p99 and max of the poll durations in the window, in seconds."""
+		with self.lock:
+			durations = sorted(self.durations)
+			last = self.durations[-1] if self.durations else 0
+		def percentile(p):
+			if not durations:
+				return 0
+			return durations[min(len(durations) - 1, int(p / 100 * len(durations)))]
+
+		return {
+		"last" : last,
+		"p50" : percentile(50),
+		"p95" : percentile(95),
+		"p99" : percentile(99),
+		"max" : durations[-1] if durations else 0,
+		}
+
+	def summary(self):
+		"""Formats the stats for the status panel."""
+		s = self.stats()
+		ms = lambda x: f"{round(x * 1000)}ms"
+		text = f"Poll latency: {ms(s['last'])} (p50 {ms(s['p50'])}, p95 {ms(s['p95'])}, p99 {ms(s['p99'])}, max {ms(s['max'])})"
+		if self.errors:
+			text += f"\nPoll failing ({self.errors}x), backing off {round(min(self.interval * 2 ** self.errors, self.max_backoff), 1)}s."
+		else:
+			text += f"\nPoll interval: {self.interval}s ± {self.jitter}s"
+		return text
+
+def main():
+	scheduler = PollScheduler(interval=0.05, jitter=0.01)
+	for i in range(40):
+		scheduler.wait()
+		scheduler.begin()
+		time.sleep(random.choice([0.001, 0.002, 0.003, 0.02]))
+		if 20 <= i < 23:
+			scheduler.failed()
+		else:
+			scheduler.succeeded()
+	print(scheduler.summary())
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,261 @@
+import os
+import time
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+try:
+	import pyautogui
+except Exception:
+	pyautogui = None # no display, only replay works
+try:
+	import mss
+except ImportError:
+	mss = None # optional, pip install mss for the fast backend
+
+BACKEND = "auto" # "mss", "pyautogui", or a folder of screenshots / a video to replay
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+class PyAutoGuiCapture:
+	"""Screenshots through pyautogui. Works everywhere pyautogui does, but every grab builds a PIL image first."""
+	name = "pyautogui"
+	to_gray = cv2.COLOR_RGB2GRAY
+	to_bgr = cv2.COLOR_RGB2BGR
+
+	def grab(self, region=None):
+		"""Returns an RGB frame of region (left, top, width, height), or of the whole screen."""
+		return np.asarray(pyautogui.screenshot(region=region))
+
+	def size(self):
+		return tuple(pyautogui.size())
+
+class MssCapture:
+	"""
+	Screenshots through mss, which copies the screen into a shared buffer (XShm on Linux, a DIB
+	section on Windows). Frames are numpy views over that buffer, no PIL image is made.
+	Each thread gets its own mss instance, as they are not safe to share.
+	"""
+	name = "mss"
+	to_gray = cv2.COLOR_BGRA2GRAY
+	to_bgr = cv2.COLOR_BGRA2BGR
+
+	def __init__(self):
+		if mss is None:
+			raise RuntimeError("mss is not installed.")
+		self.local = threading.local()
+
+	def sct(self):
+		sct = getattr(self.local, "sct", None)
+		if sct is None:
+			sct = self.local.sct = mss.mss()
+		return sct
+
+	def grab(self, region=None):
+		"""Returns a BGRA frame of region (left, top, width, height), or of the primary screen."""
+		sct = self.sct()
+		if region:
+			left, top, width, height = region
+			monitor = {"left": left, "top": top, "width": width, "height": height}
+		else:
+			monitor = sct.monitors[1]
+		shot = sct.grab(monitor)
+		return np.frombuffer(shot.raw, np.uint8).reshape(shot.height, shot.width, 4)
+
+	def size(self):
+		monitor = self.sct().monitors[1]
+		return (monitor["width"], monitor["height"])
+
+class ReplayCapture:
+	"""
+	Plays back a recorded session instead of the screen: a screenshot, a folder of screenshots
+	(in name order) or a video such as output.avi. Each grab returns the next frame, starting over at the end if
+	loop is set, so detection and recording can run without a display.
+	"""
+	name = "replay"
+	to_gray = cv2.COLOR_BGR2GRAY
+	to_bgr = None # frames are BGR already
+
+	def __init__(self, source, loop=True):
+		self.source = source
+		self.loop = loop
+		self.lock = threading.Lock()
+		self.video = None
+		self.files = []
+		self.position = 0
+		if os.path.isdir(source):
+			self.files = sorted(os.path.join(source, f) for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTENSIONS))
+			if not self.files:
+				raise ValueError(f"No screenshots in {source}.")
+		elif source.lower().endswith(IMAGE_EXTENSIONS):
+			self.files = [source]
+		else:
+			self.video = cv2.VideoCapture(source)
+			if not self.video.isOpened():
+				raise ValueError(f"Cannot open {source}.")
+		self.frame = self.next_frame()
+
+	def next_frame(self):
+		if self.video is not None:
+			ok, frame = self.video.read()
+			if not ok and self.loop:
+				self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+				ok, frame = self.video.read()
+			if not ok:
+				raise EOFError(f"{self.source} has no more frames.")
+			return frame
+		if self.position >= len(self.files):
+			if not self.loop:
+				raise EOFError(f"{self.source} has no more frames.")
+			self.position = 0
+		frame = cv2.imread(self.files[self.position])
+		self.position += 1
+		return frame
+
+	def grab(self, region=None):
+		"""Returns the next BGR frame, cut to region (left, top, width, height) without copying."""
+		with self.lock:
+			frame = self.frame
+			self.frame = self.next_frame() if self.video is not None or len(self.files) > 1 else frame
+		if region:
+			left, top, width, height = region
+			frame = frame[max(top, 0):top + height, max(left, 0):left + width]
+		return frame
+
+	def size(self):
+		return (self.frame.shape[1], self.frame.shape[0])
+
+class FrameCache:
+	"""
+	Keeps the last few captured frames for a short while, keyed by capture timestamp, so crops
+	of a detection come from the frame it was found in instead of a new screenshot.
+	Frames are kept as grabbed; only the crops taken from them are converted.
+	"""
+
+	def __init__(self, ttl=2.0, max_frames=4):
+		self.ttl = ttl
+		self.max_frames = max_frames
+		self.lock = threading.Lock()
+		self.frames = {} # stamp: (frame, offset, to_bgr)
+
+	def put(self, frame, offset, to_bgr):
+		"""Adds a frame whose top left corner is at offset on screen. Returns its timestamp."""
+		stamp = time.monotonic()
+		with self.lock:
+			while stamp in self.frames:
+				stamp = np.nextafter(stamp, np.inf)
+			self.frames[stamp] = (frame, offset, to_bgr)
+			for old in sorted(self.frames):
+				if len(self.frames) > self.max_frames or stamp - old > self.ttl:
+					del self.frames[old]
+		return stamp
+
+	def get(self, stamp):
+		with self.lock:
+			return self.frames.get(stamp)
+
+	def crop(self, stamp, box):
+		"""
+		Returns an RGB PIL image of box (left, top, right, bottom) in screen coords, cut from the
+		frame with that timestamp, or None if it has expired. Parts outside the frame come out black.
+		"""
+		entry = self.get(stamp)
+		if entry is None:
+			return None
+		frame, offset, to_bgr = entry
+		left, top, right, bottom = box[0] - offset[0], box[1] - offset[1], box[2] - offset[0], box[3] - offset[1]
+		x1, y1 = max(left, 0), max(top, 0)
+		x2, y2 = min(right, frame.shape[1]), min(bottom, frame.shape[0])
+		if x2 <= x1 or y2 <= y1:
+			return Image.new("RGB", (right - left, bottom - top))
+		part = frame[y1:y2, x1:x2]
+		if to_bgr == cv2.COLOR_RGB2BGR:
+			part = part.copy()
+		else:
+			part = cv2.cvtColor(convert(part, to_bgr), cv2.COLOR_BGR2RGB)
+		return Image.fromarray(part).crop((left - x1, top - y1, right - x1, bottom - y1))
+
+frames = FrameCache()
+capture = None
+capture_lock = threading.Lock()
+
+def make_capture(name):
+	if name == "auto":
+		name = "mss" if mss is not None else "pyautogui"
+	if name == "mss":
+		return MssCapture()
+	if name == "pyautogui":
+		return PyAutoGuiCapture()
+	return ReplayCapture(name)
+
+def get_capture():
+	"""Returns the shared capture backend, picked by BACKEND (or the TAPD_CAPTURE environment variable) on first use."""
+	global capture
+	with capture_lock:
+		if capture is None:
+			capture = make_capture(os.environ.get("TAPD_CAPTURE", BACKEND))
+		return capture
+
+def set_capture(new_capture):
+	global capture
+	with capture_lock:
+		capture = new_capture
+
+def convert(frame, code):
+	return frame if code is None else cv2.cvtColor(frame, code)
+
+def grab_gray(region=None):
+	"""Returns a grayscale frame of region (left, top, width, height), or of the screen."""
+	cap = get_capture()
+	return convert(cap.grab(region), cap.to_gray)
+
+def grab_bgr(region=None):
+	"""Returns a BGR frame, the format cv2.VideoWriter takes."""
+	cap = get_capture()
+	return convert(cap.grab(region), cap.to_bgr)
+
+def grab_image(region=None):
+	"""Returns an RGB PIL image, like pyautogui.screenshot()."""
+	cap = get_capture()
+	frame = cap.grab(region)
+	if cap.to_bgr == cv2.COLOR_RGB2BGR:
+		return Image.fromarray(frame)
+	return Image.fromarray(cv2.cvtColor(convert(frame, cap.to_bgr), cv2.COLOR_BGR2RGB))
+
+def latency_report(captures=None, region=None, frames=30):
+	"""
+	Times grab + grayscale conversion for each capture backend, the work one detection does
+	before matching. Returns {name: {"p50": ms, "p95": ms, "max": ms}} and prints it.
+	Backends that cannot run here are skipped.
+	"""
+	if captures is None:
+		captures = []
+		for name in ("pyautogui", "mss"):
+			try:
+				captures.append(make_capture(name))
+			except Exception as e:
+				print(f"{name}: unavailable ({e})")
+	report = {}
+	for cap in captures:
+		times = []
+		try:
+			for i in range(frames):
+				t = time.perf_counter()
+				convert(cap.grab(region), cap.to_gray)
+				times.append((time.perf_counter() - t) * 1000)
+		except Exception as e:
+			print(f"{cap.name}: unavailable ({e})")
+			continue
+		times.sort()
+		report[cap.name] = {
+			"p50": round(times[len(times) // 2], 2),
+			"p95": round(times[min(len(times) - 1, int(len(times) * 0.95))], 2),
+			"max": round(times[-1], 2),
+			}
+		print(f"{cap.name}: p50 {report[cap.name]['p50']}ms, p95 {report[cap.name]['p95']}ms, max {report[cap.name]['max']}ms over {frames} frames")
+	return report
+
+def main():
+	latency_report()
+
+if __name__ == "__main__":
+	main()
@@ -1,47 +1,278 @@
 import cv2
 import numpy as np
-import pyautogui
+from screen_capture import get_capture, grab_bgr
+from image_detection import detector, thumbnail
 import threading
+import time
+import datetime
+import os
+import traceback
+from collections import deque
+from queue import Queue, Full
 import tkinter as tk
 
-class MyThread(threading.Thread):
-	"""Thread class with a stop() method. The thread itself has to check
-	regularly for the stopped() condition."""
+SAME = "same" # queued in place of a frame that has not changed
+
+class PreRoll:
+	"""
+	Always-on, low cost recording of the last few seconds, so a recording started on an update
+	also shows what led up to it.
+	Frames are grabbed at a low rate, downscaled and jpeg encoded into a ring buffer that keeps at
+	most seconds of footage and never more than max_bytes of encoded frames.
+	"""
+
+	def __init__(self, seconds=10, fps=4.0, scale=0.5, quality=70, max_bytes=64 * 1024 * 1024):
+		self.seconds = seconds
+		self.fps = fps
+		self.scale = scale
+		self.quality = quality
+		self.max_bytes = max_bytes
+		self.lock = threading.Lock()
+		self.frames = deque() # (monotonic time, jpeg bytes)
+		self.bytes = 0
+		self.running = threading.Event()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, daemon=True)
+
+	def start(self):
+		self.running.set()
+		self.thread.start()
+		return self
+
+	def pause(self):
+		self.running.clear()
+
+	def resume(self):
+		self.running.set()
 
-	def __init__(self, *args, **kwargs):
-		super(MyThread, self).__init__(*args, **kwargs)
-		self._stop = threading.Event()
- 
-	# function using _stop function
 	def stop(self):
-		self._stop.set()
- 
-	def stopped(self):
-		return self._stop.isSet()
- 
+		self.stopped.set()
+		self.running.set()
+		self.thread.join()
+
 	def run(self):
-		SCREEN_SIZE = tuple(pyautogui.size())
-		fourcc = cv2.VideoWriter_fourcc(*"XVID")
-		fps = 12.0
-		out = cv2.VideoWriter("output.avi", fourcc, fps, (SCREEN_SIZE))
+		interval = 1 / self.fps
+		while not self.stopped.is_set():
+			self.running.wait()
+			started = time.monotonic()
+			frame = grab_bgr()
+			small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+			ok, jpeg = cv2.imencode(".jpg", small, (cv2.IMWRITE_JPEG_QUALITY, self.quality))
+			if ok:
+				self.add(started, jpeg.tobytes())
+			self.stopped.wait(max(0, interval - (time.monotonic() - started)))
+
+	def add(self, stamp, jpeg):
+		with self.lock:
+			self.frames.append((stamp, jpeg))
+			self.bytes += len(jpeg)
+			while self.frames and (self.bytes > self.max_bytes or stamp - self.frames[0][0] > self.seconds):
+				self.bytes -= len(self.frames.popleft()[1])
+
+	def drain(self):
+		"""Returns the buffered [(monotonic time, jpeg bytes)], oldest first, and empties the buffer."""
+		with self.lock:
+			frames = list(self.frames)
+			self.frames.clear()
+			self.bytes = 0
+		return frames
+
+class Recorder:
+	"""
+	Records the screen (or a region of it, such as FOREGROUND for the browser window) into
+	timestamped video segments at a steady frame rate.
+	A capture thread grabs a frame on every tick of a fixed-rate clock and hands it to an encoder
+	thread through a bounded queue, so slow encoding never holds up capturing. Ticks the capture
+	thread was too late for are filled by repeating the last frame, which keeps playback at real
+	speed. Frames that do not fit in the queue are dropped and counted, and the next frame
+	that fits is repeated in their place. A frame whose thumbnail has not changed is not
+	converted or scaled again, the encoder repeats the previous one.
+	A new segment is started every segment_seconds, and the oldest segments in directory are
+	deleted whenever they add up to more than budget_bytes.
+	Given a PreRoll, its buffered footage is taken on start() and written on stop(), into a
+	segment of its own that comes before the first live one, so start() returns at once and
+	writing it never competes with the live recording. The pre-roll is paused while recording
+	and resumed afterwards.
+	"""
 
+	def __init__(self, directory="recordings", fps=12.0, region=None, scale=1.0, segment_seconds=300, budget_bytes=2 * 1024**3, queue_size=24, fourcc="XVID", pre_roll=None):
+		self.directory = directory
+		self.fps = fps
+		self.region = detector.resolve_region(region)
+		self.segment_frames = max(1, int(segment_seconds * fps))
+		self.budget_bytes = budget_bytes
+		self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+		self.pre_roll = pre_roll
+		self.pre_roll_frames = [] # taken from pre_roll on start(), written on stop()
+		self.pre_roll_end = None
+		self.started = None # stamp of start(), names the pre-roll segment
+		self.screen_size = get_capture().size()
+		width, height = self.region[2:] if self.region else self.screen_size
+		self.size = (max(1, int(width * scale)), max(1, int(height * scale)))
+		os.makedirs(directory, exist_ok=True)
+		self.out = None
+		self.file_name = None
+		self.segment_written = 0
+		self.last = None # last frame written, as encoded
+		self.queue = Queue(maxsize=queue_size)
+		self.stopped = threading.Event()
+		self.captured = 0
+		self.unchanged = 0 # frames that matched the previous one and were repeated as is
+		self.dropped = 0 # frames the encoder could not keep up with
+		self.failed = 0 # grabs that raised, their ticks are filled by the next frame
+		self.late = 0 # ticks the capture thread missed, filled with the previous frame
+		self.written = 0
+		self.segments = 0
+		self.max_lag = 0.0 # seconds a grab started after its tick
+		self.capturer = threading.Thread(target=self.capture, daemon=True)
+		self.encoder = threading.Thread(target=self.encode, daemon=True)
+
+	def start(self):
+		self.started = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+		if self.pre_roll:
+			self.pre_roll.pause()
+			self.pre_roll_frames = self.pre_roll.drain()
+			self.pre_roll_end = time.monotonic()
+		self.capturer.start()
+		self.encoder.start()
+		return self
+
+	def write_pre_roll(self, frames, until):
+		"""
+		Writes buffered frames cut to the region and scaled, each repeated for as long as it was on
+		screen, into a segment named to sort before the live ones.
+		"""
+		if not frames:
+			return
+		file_name = os.path.join(self.directory, f"recording-{self.started}-0.avi")
+		out = cv2.VideoWriter(file_name, self.fourcc, self.fps, self.size)
+		try:
+			for i, (stamp, jpeg) in enumerate(frames):
+				end = frames[i + 1][0] if i + 1 < len(frames) else until
+				frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+				if self.region:
+					fx, fy = frame.shape[1] / self.screen_size[0], frame.shape[0] / self.screen_size[1]
+					left, top, width, height = self.region
+					frame = frame[int(top * fy):int((top + height) * fy), int(left * fx):int((left + width) * fx)]
+				frame = cv2.resize(frame, self.size)
+				copies = max(1, round((end - stamp) * self.fps))
+				for j in range(copies):
+					out.write(frame)
+				self.written += copies
+		finally:
+			out.release()
+		self.segments += 1
+
+	def capture(self):
+		interval = 1 / self.fps
+		tick = time.monotonic()
+		owed = 0 # ticks of dropped frames, made up by the next frame that gets through
+		small = None
+		try:
+			while not self.stopped.wait(max(0, tick - time.monotonic())):
+				lag = time.monotonic() - tick
+				self.max_lag = max(self.max_lag, lag)
+				#the ticks that passed while this one was late still need a frame each
+				copies = 1 + int(lag / interval)
+				self.late += copies - 1
+				tick += copies * interval
+				try:
+					frame = grab_bgr(self.region)
+				except Exception:
+					#e.g. the screen is locked or the secure desktop is up, try again next tick
+					self.failed += 1
+					owed += copies
+					continue
+				self.captured += 1
+				last, small = small, thumbnail(frame)
+				if last is not None and np.array_equal(small, last):
+					frame = SAME
+					self.unchanged += 1
+				try:
+					self.queue.put_nowait((frame, copies + owed))
+					owed = 0
+				except Full:
+					self.dropped += 1
+					owed += copies
+					small = last # the next frame has to stand in for this one
+		finally:
+			self.queue.put((None, 0))
+
+	def encode(self):
 		while True:
-			if self.stopped():
-				return
-			img = pyautogui.screenshot()
-			frame = np.array(img)
-			frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-			out.write(frame)
+			frame, copies = self.queue.get()
+			if frame is None:
+				break
+			try:
+				if frame is SAME:
+					frame = self.last
+				elif (frame.shape[1], frame.shape[0]) != self.size:
+					frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+				self.write(frame, copies)
+			except Exception:
+				traceback.print_exc() #keep draining, so the capture thread never blocks on a full queue
+
+	def write(self, frame, copies):
+		for i in range(copies):
+			if self.out is None or self.segment_written >= self.segment_frames:
+				self.rotate()
+			self.out.write(frame)
+			self.segment_written += 1
+		self.written += copies
+		self.last = frame
+
+	def rotate(self):
+		"""Finishes the current segment, starts the next one and keeps the folder within budget."""
+		if self.out is not None:
+			self.out.release()
+		stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+		self.segments += 1
+		self.file_name = os.path.join(self.directory, f"recording-{stamp}-{self.segments}.avi")
+		self.out = cv2.VideoWriter(self.file_name, self.fourcc, self.fps, self.size)
+		self.segment_written = 0
+		self.enforce_budget()
+
+	def enforce_budget(self):
+		segments = sorted(
+			(os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.startswith("recording-") and f.endswith(".avi")),
+			key=os.path.getmtime,
+			)
+		sizes = {f: os.path.getsize(f) for f in segments}
+		total = sum(sizes.values())
+		for f in segments:
+			if total <= self.budget_bytes or f == self.file_name:
+				break
+			try:
+				os.remove(f)
+			except OSError:
+				continue # still open somewhere
+			total -= sizes[f]
+
+	def stop(self):
+		"""Stops capturing, writes out what is queued and finalizes the file."""
+		self.stopped.set()
+		self.capturer.join()
+		self.encoder.join()
+		if self.out is not None:
+			self.out.release()
+		try:
+			self.write_pre_roll(self.pre_roll_frames, self.pre_roll_end)
+		except Exception:
+			traceback.print_exc()
+		self.pre_roll_frames = []
+		self.enforce_budget()
+		if self.pre_roll:
+			self.pre_roll.resume()
+		print(self.summary())
 
-			# cv2.imshow("screenshot", frame)			
+	def summary(self):
+		return f"Recorded {self.written} frames in {self.segments} segment(s) to {self.directory} ({self.captured} captured, {self.unchanged} unchanged, {self.late} late ticks filled, {self.dropped} dropped, {self.failed} failed grabs, max lag {round(self.max_lag*1000)}ms)"
 
-def start_record():
-	t = MyThread()
-	t.start()
-	return t
+def start_record(pre_roll=None, **options):
+	return Recorder(pre_roll=pre_roll, **options).start()
 
-def stop_record(t):
-	t.stop()
+def stop_record(recorder):
+	recorder.stop()
 
 def main():
 	t = start_record()
@@ -54,4 +285,4 @@ def main():
 	root.mainloop()
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
@@ -0,0 +1,154 @@
+import os
+import json
+import sqlite3
+import threading
+import tempfile
+from contextlib import contextmanager
+
+BACKEND = "sqlite" # or "json"
+
+class JsonBackend:
+	"""
+	One json file per save file under files/.
+	Writes go to a temporary file that then replaces the old one, so readers only ever
+	see a complete file.
+	"""
+
+	def __init__(self, directory="files"):
+		self.directory = directory
+		self.lock = threading.Lock()
+		if not os.path.isdir(directory):
+			os.mkdir(directory)
+
+	def path(self, name):
+		return os.path.join(self.directory, name)
+
+	def read(self, name):
+		"""Returns the raw json text of a save file, or None if it does not exist."""
+		try:
+			with open(self.path(name), "r", encoding="utf-8") as f:
+				return f.read()
+		except FileNotFoundError:
+			return None
+
+	def write(self, name, text):
+		with self.lock:
+			fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=f".{name}.", suffix=".tmp")
+			try:
+				with os.fdopen(fd, "w", encoding="utf-8") as f:
+					f.write(text)
+					f.flush()
+					os.fsync(f.fileno())
+				os.replace(tmp, self.path(name))
+			except BaseException:
+				os.remove(tmp)
+				raise
+
+	def version(self, name):
+		"""Cheap change token, compared before bothering to read the file."""
+		try:
+			st = os.stat(self.path(name))
+		except FileNotFoundError:
+			return None
+		return (st.st_mtime_ns, st.st_size)
+
+	@contextmanager
+	def transaction(self):
+		with self.lock:
+			yield
+
+class SqliteBackend:
+	"""
+	All save files as rows of one SQLite database in WAL mode.
+	Writes are transactional, and readers never block (or get blocked by) a writer, so the
+	tracker thread can read while a settings dialog saves.
+	The existing files/*.json are imported the first time the database is opened.
+	"""
+
+	def __init__(self, path=os.path.join("files", "settings.db"), migrate_from="files"):
+		self.path = path
+		self.local = threading.local()
+		self.write_lock = threading.RLock()
+		directory = os.path.dirname(path)
+		if directory and not os.path.isdir(directory):
+			os.mkdir(directory)
+		conn = self.connection()
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.execute("""CREATE TABLE IF NOT EXISTS settings (
+			name TEXT PRIMARY KEY,
+			data TEXT NOT NULL,
+			version INTEGER NOT NULL DEFAULT 1
+			)""")
+		conn.commit()
+		if migrate_from:
+			self.migrate(migrate_from)
+
+	def connection(self):
+		"""sqlite3 connections can't be shared between threads, so each thread gets its own."""
+		conn = getattr(self.local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=10)
+			conn.execute("PRAGMA synchronous=NORMAL")
+			self.local.conn = conn
+		return conn
+
+	def read(self, name):
+		row = self.connection().execute("SELECT data FROM settings WHERE name = ?", (name,)).fetchone()
+		return row[0] if row else None
+
+	def write(self, name, text):
+		with self.transaction() as conn:
+			conn.execute("""INSERT INTO settings (name, data) VALUES (?, ?)
+				ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = version + 1
+				WHERE data != excluded.data""", (name, text))
+
+	def version(self, name):
+		row = self.connection().execute("SELECT version FROM settings WHERE name = ?", (name,)).fetchone()
+		return row[0] if row else None
+
+	@contextmanager
+	def transaction(self):
+		"""Groups writes into one transaction. Nested uses join the outer transaction."""
+		conn = self.connection()
+		with self.write_lock:
+			if conn.in_transaction:
+				yield conn
+				return
+			conn.execute("BEGIN IMMEDIATE")
+			try:
+				yield conn
+			except BaseException:
+				conn.rollback()
+				raise
+			conn.commit()
+
+	def migrate(self, directory):
+		"""Imports json save files that are not in the database yet. The files are left as backups."""
+		if not os.path.isdir(directory):
+			return
+		with self.transaction() as conn:
+			for file_name in os.listdir(directory):
+				if not file_name.endswith(".json"):
+					continue
+				with open(os.path.join(directory, file_name), "r", encoding="utf-8") as f:
+					text = f.read()
+				try:
+					json.loads(text)
+				except ValueError:
+					print(f"Skipping {file_name}: not valid json.")
+					continue
+				conn.execute("INSERT OR IGNORE INTO settings (name, data) VALUES (?, ?)", (file_name, text))
+
+backend = None
+backend_lock = threading.Lock()
+
+def get_backend():
+	"""Returns the shared storage backend, opening it on first use."""
+	global backend
+	with backend_lock:
+		if backend is None:
+			if BACKEND == "sqlite":
+				backend = SqliteBackend()
+			else:
+				backend = JsonBackend()
+		return backend
@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+class Tracer:
+	"""
+	Records timed spans of the claim cycle into a bounded in-memory buffer and exports them as
+	Chrome trace-event json (open in chrome://tracing or ui.perfetto.dev).
+	Recording a span is a perf_counter_ns() call at each end and one deque append, so spans can be
+	left around every stage. When the buffer is full the oldest spans are dropped.
+	"""
+
+	def __init__(self, max_spans=100000):
+		self.spans = deque(maxlen=max_spans) # (name, start ns, duration ns, thread id, args)
+		self.threads = {} # thread id: name
+		self.enabled = True
+
+	@contextmanager
+	def span(self, name, **args):
+		if not self.enabled:
+			yield
+			return
+		start = time.perf_counter_ns()
+		try:
+			yield
+		finally:
+			end = time.perf_counter_ns()
+			thread = threading.current_thread()
+			if thread.ident not in self.threads:
+				self.threads[thread.ident] = thread.name
+			self.spans.append((name, start, end - start, thread.ident, args))
+
+	def clear(self):
+		self.spans.clear()
+
+	def export(self, file_name):
+		"""Writes the buffered spans to file_name as trace-event json and empties the buffer. Returns the number of spans."""
+		spans = []
+		while self.spans:
+			spans.append(self.spans.popleft())
+		pid = os.getpid()
+		events = [
+			{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+			for tid, name in list(self.threads.items())
+			]
+		for name, start, duration, tid, args in spans:
+			events.append({
+				"name": name,
+				"ph": "X",
+				"ts": start / 1000,
+				"dur": duration / 1000,
+				"pid": pid,
+				"tid": tid,
+				"args": {k: str(v) for k, v in args.items()},
+				})
+		directory = os.path.dirname(file_name)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		with open(file_name, "w", encoding="utf-8") as f:
+			json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+		return len(spans)
+
+tracer = Tracer()
+span = tracer.span
+
+def main():
+	for i in range(3):
+		with span("cycle", n=i):
+			with span("poll"):
+				time.sleep(0.01)
+			with span("claim"):
+				time.sleep(0.02)
+	t = time.perf_counter()
+	for i in range(100000):
+		with span("empty"):
+			pass
+	print(f"{round((time.perf_counter() - t) * 10, 2)}us per span")
+	print(f"Exported {tracer.export('trace.json')} spans to trace.json")
+
+if __name__ == "__main__":
+	main()